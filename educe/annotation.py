@@ -18,7 +18,257 @@ some sort of graph representation of them
 # pylint: disable=too-many-arguments, protected-access
 # pylint: disable=too-few-public-methods
 
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
 from itertools import chain
+from operator import attrgetter
+
+from six.moves.collections_abc import MutableSequence
+
+
+class _Clock(object):
+    """
+    Counts the in-place modifications made to the annotations of a
+    document, so that caches over them (see eg. `Document.span_index`
+    or `Standoff.text_span`) can tell when to recompute.
+
+    Annotations and their spans do not know what document they are in;
+    rather, they hang on to the clock of any document that indexed them
+    (see `_watch`) and move it forward when they are modified. So an
+    annotation that has never been indexed can be modified for free,
+    and modifying it leaves the caches of other documents alone.
+    """
+    __slots__ = ('spans', 'ids')
+
+    def __init__(self):
+        self.spans = 0
+        "number of changes to spans, or what non-terminals span"
+        self.ids = 0
+        "number of changes to annotation ids"
+
+
+def _clocks(clock):
+    """
+    The clocks in the `_clock` field of an annotation or span: it
+    holds either None, a single `_Clock` (the common case), or a tuple
+    of them if several documents have indexed it
+    """
+    if clock is None:
+        return ()
+    elif isinstance(clock, tuple):
+        return clock
+    else:
+        return (clock,)
+
+
+def _touch_spans(clock):
+    """
+    Note that some span watched by `clock` has been modified in place
+    """
+    for clk in _clocks(clock):
+        clk.spans += 1
+
+
+def _touch_ids(clock):
+    """
+    Note that some annotation watched by `clock` has been given a new
+    id (see `Document.get_annotation`)
+    """
+    for clk in _clocks(clock):
+        clk.ids += 1
+
+
+def _span_stamp(clock):
+    """
+    State of the spans watched by `clock`, to be recorded by caches
+    built over them (None if there is nothing watching them)
+    """
+    if clock is None:
+        return None
+    elif isinstance(clock, tuple):
+        return tuple(c.spans for c in clock)
+    else:
+        return clock.spans
+
+
+def _watch(obj, clock):
+    """
+    Have an annotation (and its span) report its modifications to
+    `clock` from now on, on top of any other clocks it reports to.
+    Objects with no room for a clock are left alone.
+    """
+    for item in (obj, getattr(obj, 'span', None)):
+        old = getattr(item, '_clock', None)
+        if item is None or old is clock or clock in _clocks(old):
+            continue
+        try:
+            object.__setattr__(item, '_clock',
+                               clock if old is None else
+                               _clocks(old) + (clock,))
+        except (AttributeError, TypeError):
+            pass
+
+
+def _tracked(name, doc, touch=_touch_spans, wrap=None):
+    """
+    Property over a field (slot) that determines text spans (or, given
+    another `touch`, some other derived information). Assigning it once
+    it has been set counts as a modification, which is reported to the
+    clocks of the annotation (see `_Clock`). Values other than None are
+    passed through `wrap(value, self)` first, if given.
+    """
+    def _set(self, value):
+        "field setter"
+        if wrap is not None and value is not None:
+            value = wrap(value, self)
+        if getattr(self, name, None) is not None:
+            clock = getattr(self, '_clock', None)
+            touch(clock)
+            setattr(self, name, value)
+            # pass the clocks on to the new span, if that is what it is
+            for clk in _clocks(clock):
+                _watch(self, clk)
+        else:
+            setattr(self, name, value)
+    return property(attrgetter(name), _set, doc=doc)
+
+
+class _VersionedList(MutableSequence):
+    """
+    A view on a list that counts the in-place modifications made
+    through it, so that anything derived from its contents can tell
+    when to recompute.
+
+    The list is shared, not copied, so modifying it directly rather
+    than through this view goes unnoticed (save for changes in its
+    length).
+
+    :param owner: annotation whose spans depend on the contents, if
+        any; modifications are reported to its clocks (see `_Clock`)
+    """
+    def __init__(self, items, owner=None):
+        self._items = items
+        self._owner = owner
+        self._version = 0
+
+    @property
+    def version(self):
+        "stamp for the current contents"
+        return (self._version, len(self._items))
+
+    def _touch(self):
+        "record a modification"
+        self._version += 1
+        if self._owner is not None:
+            _touch_spans(getattr(self._owner, '_clock', None))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __reversed__(self):
+        return reversed(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __getitem__(self, index):
+        return self._items[index]
+
+    def __setitem__(self, index, value):
+        self._touch()
+        self._items[index] = value
+
+    def __delitem__(self, index):
+        self._touch()
+        del self._items[index]
+
+    def __add__(self, other):
+        return self._items + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self._items
+
+    def __iadd__(self, other):
+        self.extend(other)
+        return self
+
+    def __eq__(self, other):
+        if isinstance(other, _VersionedList):
+            other = other._items
+        return self._items == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(self._items)
+
+    def __copy__(self):
+        return _VersionedList(list(self._items))
+
+    def index(self, item, *args):
+        return self._items.index(item, *args)
+
+    def count(self, item):
+        return self._items.count(item)
+
+    def insert(self, index, item):
+        self._touch()
+        self._items.insert(index, item)
+
+    def append(self, item):
+        self._touch()
+        self._items.append(item)
+
+    def extend(self, items):
+        self._touch()
+        self._items.extend(items)
+
+    def remove(self, item):
+        self._touch()
+        self._items.remove(item)
+
+    def pop(self, *args):
+        self._touch()
+        return self._items.pop(*args)
+
+    def sort(self, *args, **kwargs):
+        self._touch()
+        self._items.sort(*args, **kwargs)
+
+    def reverse(self):
+        self._touch()
+        self._items.reverse()
+
+
+def _versioned(items, owner=None):
+    """
+    `items` as a `_VersionedList` for `owner`, wrapping rather than
+    copying it if it is a list (or reusing it if it is already one)
+    """
+    if isinstance(items, _VersionedList):
+        if items._owner is owner:
+            return items
+        items = items._items
+    elif not isinstance(items, list):
+        items = list(items)
+    return _VersionedList(items, owner)
+
+
+class _TextSpanCycle(Exception):
+    """
+    Raised when we find a non-terminal annotation among its own members
+    """
+    pass
+
+
+_COMPUTING = object()
+"placeholder for a text span that is being computed"
 
 
 class Span(object):
@@ -38,9 +288,23 @@ class Span(object):
     So `(0,5)` covers the whole word above, and `(1,2)`
     picks out the letter "o"
     """
+    __slots__ = ('char_start', 'char_end', '_clock')
+
     def __init__(self, start, end):
-        self.char_start = start
-        self.char_end = end
+        # bypass __setattr__: a fresh span cannot be in any cache yet
+        _SET_SPAN_START(self, start)
+        _SET_SPAN_END(self, end)
+        _SET_SPAN_CLOCK(self, None)
+
+    def __setattr__(self, name, value):
+        _touch_spans(self._clock)
+        object.__setattr__(self, name, value)
+
+    def __reduce__(self):
+        return (Span, (self.char_start, self.char_end), self._clock)
+
+    def __setstate__(self, clock):
+        _SET_SPAN_CLOCK(self, clock)
 
     def __str__(self):
         return '(%d,%d)' % (self.char_start, self.char_end)
@@ -178,11 +442,18 @@ class Span(object):
         return Span(big_start, big_end)
 
 
+_SET_SPAN_START = Span.char_start.__set__
+_SET_SPAN_END = Span.char_end.__set__
+_SET_SPAN_CLOCK = Span._clock.__set__
+
+
 # pylint: disable=invalid-name
 class RelSpan(object):
     """
     Which two units a relation connects.
     """
+    __slots__ = ('t1', 't2')
+
     def __init__(self, t1, t2):
         self.t1 = t1
         "string: id of an annotation"
@@ -204,6 +475,9 @@ class Standoff(object):
     A standoff object ultimately points to some piece of text.
     The pointing is not necessarily direct though
     """
+    # no slots of our own, but subclasses may do without a __dict__
+    __slots__ = ()
+
     def __init__(self, origin=None):
         self.origin = origin
 
@@ -238,6 +512,8 @@ class Standoff(object):
         Corner case: if this is an empty non-terminal (which would be a very
         weird thing indeed), return None
         """
+        if self._members() is None:
+            return Span(self.span.char_start, self.span.char_end)
         terminals = list(self._terminals())
         if len(terminals) > 0:
             start = min(t.span.char_start for t in terminals)
@@ -246,6 +522,44 @@ class Standoff(object):
         else:
             return None
 
+    def _cached_text_span(self, stamp):
+        """
+        `text_span` for non-terminal annotations that hang on to it in
+        a `_text_span_cache` field until `stamp` changes. The members
+        are made to report to our clocks, so that `stamp` moves on
+        when they are modified.
+
+        The span is worked out from the (likewise cached) spans of the
+        members, so computing it for all the annotations in a document
+        amounts to a single bottom-up pass. We fall back to walking the
+        terminals if we find ourselves among our own (indirect) members.
+        """
+        cached = self._text_span_cache
+        if cached is _COMPUTING:
+            raise _TextSpanCycle()
+        elif cached is None or cached[0] != stamp:
+            self._text_span_cache = _COMPUTING
+            members = self._members()
+            for clock in _clocks(self._clock):
+                for member in members:
+                    _watch(member, clock)
+            try:
+                span = None
+                for member in members:
+                    mspan = member.text_span()
+                    if mspan is not None:
+                        span = mspan if span is None else span.merge(mspan)
+            except _TextSpanCycle:
+                span = Standoff.text_span(self)
+            finally:
+                self._text_span_cache = None
+            cached = (stamp, span)
+            self._text_span_cache = cached
+        span = cached[1]
+        # return a copy to be on the safe side; callers used to get a
+        # fresh span on every call
+        return None if span is None else Span(span.char_start, span.char_end)
+
     def encloses(self, other):
         """
         True if this annotations's span encloses the span of the other.
@@ -274,9 +588,15 @@ class Annotation(Standoff):
     * type:     some key label (we call a type)
     * features: an attribute to value dictionary
     """
+    # the fields themselves are declared as slots in the concrete
+    # annotation classes (see `_ANNOTATION_SLOTS`) so that a class may
+    # inherit from both this and another slotted class, eg. `Span`
+    __slots__ = ()
+
     def __init__(self, anno_id, span, atype, features,
                  metadata=None, origin=None):
         Standoff.__init__(self, origin)
+        self._clock = None
         self.origin = origin
         self._anno_id = anno_id
         self.span = span
@@ -284,8 +604,11 @@ class Annotation(Standoff):
         self.features = features
         self.metadata = metadata
 
+    span = _tracked('_span', "what this annotation covers (a `Span` for units)")
+    _anno_id = _tracked('_anno_id_', "see `local_id`", touch=_touch_ids)
+
     def __lt__(self, other):
-        return self._anno_id < other._anno_id
+        return self._anno_id_ < other._anno_id_
 
     def __str__(self):
         feats = str(self.features)
@@ -297,7 +620,7 @@ class Annotation(Standoff):
         An identifier which is sufficient to pick out this annotation within a
         single annotation file
         """
-        return self._anno_id
+        return self._anno_id_
 
     def identifier(self):
         """
@@ -318,17 +641,24 @@ class Annotation(Standoff):
         See also `position` as potentially a safer alternative to this
         (and what we mean by safer)
         """
-        local_id = self._anno_id
+        local_id = self._anno_id_
         if self.origin is None:
             return local_id
         else:
             return self.origin.mk_global_id(local_id)
 
 
+_ANNOTATION_SLOTS = ('origin', '_anno_id_', '_span', 'type', 'features',
+                     'metadata', '_clock')
+"fields of an `Annotation`, to be declared by concrete subclasses"
+
+
 class Unit(Annotation):
     """
     An annotation over a span of text
     """
+    __slots__ = _ANNOTATION_SLOTS
+
     def __init__(self, unit_id, span, utype, features,
                  metadata=None, origin=None):
         Annotation.__init__(self, unit_id, span, utype, features,
@@ -392,17 +722,31 @@ class Relation(Annotation):
     metadata : TODO
         TODO
     """
+    __slots__ = _ANNOTATION_SLOTS + ('_source', '_target',
+                                     '_text_span_cache')
+
+    source = _tracked('_source',
+                      'source annotation; will be defined by fleshout')
+    target = _tracked('_target',
+                      'target annotation; will be defined by fleshout')
+
     def __init__(self, rel_id, span, rtype, features, metadata=None):
         Annotation.__init__(self, rel_id, span, rtype, features, metadata)
         self.source = None  # to be defined in fleshout
-        'source annotation; will be defined by fleshout'
-
         self.target = None
-        'target annotation; will be defined by fleshout'
+        self._text_span_cache = None
 
     def _members(self):
         return [self.source, self.target]
 
+    def text_span(self):
+        stamp = _span_stamp(self._clock)
+        if stamp is None:
+            # not indexed by any document, so there is no telling
+            # when a cached span would go stale
+            return Standoff.text_span(self)
+        return self._cached_text_span(stamp)
+
     def fleshout(self, objects):
         """
         Given a dictionary mapping ids to annotation objects, set this
@@ -429,11 +773,21 @@ class Schema(Annotation):
 
     Use the `members` field to grab the annotations themselves.
     But note that it is only created when `fleshout` is called.
+    It may be modified in place, but only through the field: the
+    list assigned to it is not copied, and changes made to that
+    list directly are not seen by `text_span` caches.
 
     :type units: set(string)
     :type relations: set(string)
     :type schemas: set(string)
     """
+    __slots__ = _ANNOTATION_SLOTS + ('units', 'relations', 'schemas',
+                                     '_members_', '_text_span_cache')
+
+    members = _tracked('_members_',
+                       'member annotations; will be defined by fleshout',
+                       wrap=_versioned)
+
     def __init__(self, rel_id, units, relations, schemas, stype,
                  features, metadata=None):
         self.units = units
@@ -441,6 +795,7 @@ class Schema(Annotation):
         self.schemas = schemas
         member_ids = units | relations | schemas
         self.members = None  # to be defined :-/
+        self._text_span_cache = None
         Annotation.__init__(self, rel_id, member_ids, stype,
                             features, metadata)
 
@@ -459,12 +814,159 @@ class Schema(Annotation):
         Given a dictionary mapping ids to annotation objects, set this
         schema's `members` field to point to the appropriate objects
         """
-        self.members = []
+        members = []
         for i in self.span:
             if i not in objects:
                 oops = 'There is no annotation with id %s [schema member]' % i
                 raise Exception(oops)
-            self.members.append(objects[i])
+            members.append(objects[i])
+        self.members = members
+
+    def text_span(self):
+        stamp = _span_stamp(self._clock)
+        if stamp is None:
+            # not indexed by any document, so there is no telling
+            # when a cached span would go stale
+            return Standoff.text_span(self)
+        return self._cached_text_span(stamp)
+
+
+class _SpanTable(object):
+    """
+    Annotations sorted by start offset, along with a max-end segment
+    tree over that order, so that we can pick out the annotations that
+    start before some point and end after another without visiting
+    the ones that don't.
+
+    :param items: (position, annotation) pairs; the position is the
+        order results should come back in
+    """
+    def __init__(self, items):
+        rows = sorted(((a.span.char_start, a.span.char_end, pos, a)
+                       for pos, a in items),
+                      key=lambda r: r[:3])
+        self._starts = [r[0] for r in rows]
+        self._ends = [r[1] for r in rows]
+        self._rows = [(r[2], r[3]) for r in rows]
+        size = 1
+        while size < len(rows):
+            size *= 2
+        max_end = [float('-inf')] * (2 * size)
+        max_end[size:size + len(rows)] = self._ends
+        for i in range(size - 1, 0, -1):
+            max_end[i] = max(max_end[2 * i], max_end[2 * i + 1])
+        self._size = size
+        self._max_end = max_end
+
+    def _ending_after(self, limit, min_end):
+        """
+        Indices `i < limit` (in sorted order) of annotations that end
+        at or after `min_end`
+        """
+        res = []
+        max_end = self._max_end
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, low, high = stack.pop()
+            if low >= limit or max_end[node] < min_end:
+                continue
+            elif high - low == 1:
+                res.append(low)
+            else:
+                mid = (low + high) // 2
+                stack.append((2 * node + 1, mid, high))
+                stack.append((2 * node, low, mid))
+        return res
+
+    def enclosed(self, start, end):
+        "rows for annotations within `[start, end]`"
+        low = bisect_left(self._starts, start)
+        high = bisect_right(self._starts, end)
+        return [self._rows[i] for i in range(low, high)
+                if self._ends[i] <= end]
+
+    def containing(self, start, end):
+        "rows for annotations around `[start, end]`"
+        limit = bisect_right(self._starts, start)
+        return [self._rows[i] for i in self._ending_after(limit, end)]
+
+    def touching(self, start, end):
+        """
+        rows for annotations that have at least one point in common
+        with `[start, end]` (a superset of those that overlap it)
+        """
+        limit = bisect_right(self._starts, end)
+        return [self._rows[i] for i in self._ending_after(limit, start)]
+
+
+class SpanIndex(object):
+    """
+    Index over the spans of a collection of annotations (typically the
+    units of a document), answering enclosure and overlap queries in
+    logarithmic time plus the number of annotations returned, rather than
+    by scanning the whole collection.
+
+    Every query can be limited to annotations of some types. Results come
+    back in the same order as in the collection the index was built from.
+
+    Note that this is a snapshot: if the annotations or their spans change,
+    build a new index (`Document.span_index` does this for you)
+
+    :param annotations: annotations with a `Span` for a `span`
+    :type annotations: iterable of `Annotation`
+    """
+    def __init__(self, annotations):
+        items = list(enumerate(annotations))
+        of_type = defaultdict(list)
+        for pos, anno in items:
+            of_type[anno.type].append((pos, anno))
+        self._all = _SpanTable(items)
+        self._of_type = dict((k, _SpanTable(v)) for k, v in of_type.items())
+
+    def types(self):
+        """
+        Annotation types occuring in the index
+        """
+        return frozenset(self._of_type)
+
+    def _query(self, method, span, types, pred=None):
+        "run a query on the relevant tables, merge results in order"
+        if types is None:
+            tables = [self._all]
+        else:
+            tables = [self._of_type[t] for t in frozenset(types)
+                      if t in self._of_type]
+        rows = []
+        for table in tables:
+            rows.extend(getattr(table, method)(span.char_start,
+                                               span.char_end))
+        rows.sort(key=lambda r: r[0])
+        if pred is None:
+            return [anno for _, anno in rows]
+        else:
+            return [anno for _, anno in rows if pred(anno)]
+
+    def enclosed(self, span, types=None):
+        """
+        Annotations (of the given types if any) enclosed by the span,
+        ie. for which `span.encloses(anno.span)`
+        """
+        return self._query('enclosed', span, types)
+
+    def containing(self, span, types=None):
+        """
+        Annotations (of the given types if any) containing the span,
+        ie. for which `anno.span.encloses(span)`
+        """
+        return self._query('containing', span, types)
+
+    def overlapping(self, span, types=None):
+        """
+        Annotations (of the given types if any) overlapping the span,
+        ie. for which `span.overlaps(anno.span)`
+        """
+        return self._query('touching', span, types,
+                           pred=lambda x: span.overlaps(x.span))
 
 
 class Document(Standoff):
@@ -476,6 +978,8 @@ class Document(Standoff):
     def __init__(self, units, relations, schemas, text):
         Standoff.__init__(self, None)
 
+        self._clock = _Clock()
+        self._text_span_cache = None
         self.units = units
         self.relations = relations
         self.schemas = schemas
@@ -493,8 +997,111 @@ class Document(Standoff):
         for anno in self.schemas:
             anno.fleshout(objects)
 
+        # no duplicate ids: this can double as our id index
+        if len(objects) == (len(self._units) + len(self._relations) +
+                            len(self._schemas)):
+            self._id_index = (self._id_stamp(), objects)
+
         self._text = text
 
+    def __getstate__(self):
+        # derived indices are cheap to rebuild and not worth copying
+        state = self.__dict__.copy()
+        state['_span_index'] = None
+        state['_text_span_cache'] = None
+        state['_id_index'] = None
+        return state
+
+    @property
+    def units(self):
+        "unit-level annotations in this document"
+        return self._units
+
+    @units.setter
+    def units(self, units):
+        self._units = _versioned(units)
+        self._watch_all(self._units)
+        self._span_index = None
+        self._text_span_cache = None
+        self._id_index = None
+
+    @property
+    def relations(self):
+        "relation annotations in this document"
+        return self._relations
+
+    @relations.setter
+    def relations(self, relations):
+        self._relations = _versioned(relations)
+        self._watch_all(self._relations)
+        self._text_span_cache = None
+        self._id_index = None
+
+    @property
+    def schemas(self):
+        "schema annotations in this document"
+        return self._schemas
+
+    @schemas.setter
+    def schemas(self, schemas):
+        self._schemas = _versioned(schemas)
+        self._watch_all(self._schemas)
+        self._text_span_cache = None
+        self._id_index = None
+
+    def _watch_all(self, annos):
+        "have annotations report their modifications to our clock"
+        clock = self._clock
+        for anno in annos:
+            _watch(anno, clock)
+
+    def span_index(self):
+        """
+        `SpanIndex` over the units of this document.
+
+        This is built on first use and rebuilt whenever the unit list
+        has been changed or some span has been modified since.
+
+        :rtype: :py:class:`SpanIndex`
+        """
+        stamp = (self._units.version, self._clock.spans)
+        cached = self._span_index
+        if cached is None or cached[0] != stamp:
+            # units added since could still be unknown to our clock
+            self._watch_all(self._units)
+            cached = (stamp, SpanIndex(self._units))
+            self._span_index = cached
+        return cached[1]
+
+    def _id_stamp(self):
+        "state of the annotation lists and ids behind the id index"
+        return (self._units.version,
+                self._relations.version,
+                self._schemas.version,
+                self._clock.ids)
+
+    def get_annotation(self, local_id, default=None):
+        """
+        The annotation in this document with the given local id
+        (see `Annotation.local_id`), or `default` if there is none.
+        If there are several, we return the first in the order of
+        `annotations()`.
+
+        This is looked up in a dictionary, which is built on first
+        use and rebuilt whenever annotations have been added, removed
+        or renamed since.
+        """
+        stamp = self._id_stamp()
+        cached = self._id_index
+        if cached is None or cached[0] != stamp:
+            index = {}
+            for anno in reversed(self.annotations()):
+                _watch(anno, self._clock)
+                index[anno.local_id()] = anno
+            cached = (stamp, index)
+            self._id_index = cached
+        return cached[1].get(local_id, default)
+
     def annotations(self):
         """
         All annotations associated with this document
@@ -504,6 +1111,12 @@ class Document(Standoff):
     def _members(self):
         return self.annotations()
 
+    def text_span(self):
+        return self._cached_text_span((self._clock.spans,
+                                       self._units.version,
+                                       self._relations.version,
+                                       self._schemas.version))
+
     def fleshout(self, origin):
         """
         See `set_origin`
@@ -543,3 +1156,13 @@ class Document(Standoff):
             return self._text
         else:
             return self._text[span.char_start:span.char_end]
+
+    def set_text(self, text):
+        """
+        Associate a text with these annotations (or None). The text is
+        used as is, not copied, so several documents can share one
+        (eg. the annotations of different annotators on the same text)
+
+        :type text: string
+        """
+        self._text = text
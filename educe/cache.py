@@ -0,0 +1,381 @@
+# Author: Eric Kow
+# License: BSD3
+
+"""
+On-disk cache of parsed corpus files
+
+Parsing a corpus (Glozz XML, RST bracket strings, PDTB text) is
+typically the most expensive thing short commands do, and most of
+the time they are rerun over files that have not changed since the
+last run. A `ParseCache` stores the parsed result of each file in
+pickled form, keyed on the paths, sizes and modification times of
+the files it was read from, so that unchanged files can be loaded
+back without being parsed again.
+
+The cache is opt-in; see the `cache_dir` parameter of
+`educe.corpus.Reader.slurp`.
+
+The same directory can also hold a `ListingCache`, which saves the
+directory listings that go into finding the corpus files in the
+first place, and `FeatureStore` directories, which save features
+extracted from the documents.
+"""
+
+from collections import OrderedDict
+import errno
+import hashlib
+import os
+import tempfile
+
+from six.moves import cPickle as pickle
+
+try:
+    from os import scandir
+except ImportError:  # python < 3.5
+    scandir = None
+
+# bump this whenever the in-memory representation of parsed documents
+# changes in a way that would make older entries unsafe to load
+CACHE_FORMAT_VERSION = 3
+
+# default upper bound on the size of the cache directory (bytes)
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+
+# default number of documents a `FeatureStore` keeps in memory
+DEFAULT_MEMORY_SIZE = 64
+
+_SUFFIX = '.pickle'
+
+
+def default_cache_dir():
+    """
+    Where we put the cache if the user asks for one without saying
+    where (`$XDG_CACHE_HOME/educe`, by default `~/.cache/educe`)
+    """
+    root = os.environ.get('XDG_CACHE_HOME') or\
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(root, 'educe')
+
+
+class ParseCache(object):
+    """
+    Directory of pickled parse results.
+
+    Entries are named after a hash of the function used to read
+    them, the files they were read from (path, size, mtime) and
+    `CACHE_FORMAT_VERSION`. Changing any input file thus makes its
+    old entry unreachable; such stale entries are eventually removed
+    by eviction, which deletes the least recently used entries
+    whenever the directory grows beyond `max_size` bytes.
+
+    :param cache_dir: directory to keep entries in (created if needed)
+    :type  cache_dir: string
+
+    :param max_size: size in bytes beyond which we evict entries
+    :type  max_size: int
+    """
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError as oops:
+                if oops.errno != errno.EEXIST:
+                    raise
+
+    def key(self, read, paths):
+        """
+        Cache key for the result of `read` on `paths` (a filename or
+        tuple of filenames), or `None` if one of the files is missing
+        """
+        if not isinstance(paths, tuple):
+            paths = (paths,)
+        parts = [str(CACHE_FORMAT_VERSION),
+                 '%s.%s' % (read.__module__, read.__name__)]
+        for path in paths:
+            if path is None:
+                parts.append('')
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                return None
+            parts.append('%s:%d:%r' % (os.path.abspath(path),
+                                       stat.st_size,
+                                       stat.st_mtime))
+        digest = hashlib.sha1('\0'.join(parts).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key):
+        "path to the entry for a key"
+        return os.path.join(self.cache_dir, key + _SUFFIX)
+
+    def get(self, key):
+        """
+        Return the cached value for `key` or `None` if there is no
+        such (readable) entry
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as stream:
+                value = pickle.load(stream)
+        except (IOError, OSError):
+            return None
+        except Exception:  # pylint: disable=broad-except
+            # truncated or otherwise unreadable entry: treat as a miss
+            self._remove(path)
+            return None
+        try:
+            os.utime(path, None)  # for least-recently-used eviction
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Save a value in the cache (silently giving up if it cannot
+        be pickled)
+        """
+        handle, tmp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                            suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as stream:
+                pickle.dump(value, stream, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            self._remove(tmp_path)
+            return
+        path = self._path(key)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # eg. windows, where rename does not overwrite
+            self._remove(path)
+            os.rename(tmp_path, path)
+
+    def evict(self):
+        """
+        Delete least recently used entries until the cache holds
+        no more than `max_size` bytes
+        """
+        entries = []
+        total = 0
+        for fname in os.listdir(self.cache_dir):
+            if not fname.endswith(_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, fname)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self._remove(path)
+            total -= size
+
+    @staticmethod
+    def _remove(path):
+        "delete a file if it's there"
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def dir_signature(path):
+    """
+    Hash of the names, sizes and modification times of all files
+    under a directory (eg. to tell if resources such as lexicons have
+    changed since features were last extracted from them)
+    """
+    parts = []
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fname in sorted(files):
+            fpath = os.path.join(root, fname)
+            try:
+                stat = os.stat(fpath)
+            except OSError:
+                continue
+            parts.append('%s:%d:%r' % (os.path.relpath(fpath, path),
+                                       stat.st_size,
+                                       stat.st_mtime))
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()
+
+
+class FeatureStore(object):
+    """
+    Features extracted for the instances (eg. EDUs) of each document,
+    saved between runs.
+
+    There is one entry per document: a dictionary from instance
+    identifiers to their feature values. Entries are looked up by a
+    hash of the contents of the document they were extracted from
+    (see `key`), along with the `version` of the features, so that
+    changing either makes the old entries unreachable.
+
+    The most recently used `memory_size` entries are kept in memory;
+    the others are on disk in a `ParseCache` (if there is a
+    `cache_dir`), which does not grow beyond `max_size` bytes after
+    eviction.
+
+    :param cache_dir: directory to keep entries in (`None` to keep
+                      them in memory only)
+    :type  cache_dir: string
+
+    :param version: version of the features (should change whenever
+                    the way they are computed does, including the
+                    resources they are computed from)
+    :type  version: string
+    """
+    def __init__(self, cache_dir=None, version='',
+                 max_size=DEFAULT_MAX_SIZE,
+                 memory_size=DEFAULT_MEMORY_SIZE):
+        self.version = version
+        self.memory_size = memory_size
+        self._disk = ParseCache(cache_dir, max_size)\
+            if cache_dir is not None else None
+        self._memory = OrderedDict()
+
+    def key(self, doc_hash):
+        """
+        Key for the entry of the document with this content hash
+        """
+        parts = [str(CACHE_FORMAT_VERSION), self.version, doc_hash]
+        digest = hashlib.sha1('\0'.join(parts).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _remember(self, key, entry):
+        "put an entry in the memory tier, forgetting the oldest ones"
+        self._memory.pop(key, None)
+        self._memory[key] = entry
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return the entry for `key`, which is empty if we have not
+        seen the document before.
+
+        The entry can be filled out with the features of more
+        instances, and then saved with `put`
+        """
+        entry = self._memory.get(key)
+        if entry is None and self._disk is not None:
+            entry = self._disk.get(key)
+        if entry is None:
+            entry = {}
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Save the entry for a document
+        """
+        self._remember(key, entry)
+        if self._disk is not None:
+            self._disk.put(key, entry)
+
+    def evict(self):
+        """
+        Delete least recently used entries from the disk until it holds
+        no more than `max_size` bytes (see `ParseCache.evict`)
+        """
+        if self._disk is not None:
+            self._disk.evict()
+
+
+def list_dir(path):
+    """
+    Sorted list of the entries in a directory, as pairs of a name and
+    whether that entry is itself a directory (following symlinks)
+    """
+    if scandir is not None:
+        entries = [(x.name, x.is_dir()) for x in scandir(path)]
+    else:
+        entries = [(x, os.path.isdir(os.path.join(path, x)))
+                   for x in os.listdir(path)]
+    return sorted(entries)
+
+
+class ListingCache(object):
+    """
+    Directory listings (see `list_dir`) under a corpus directory,
+    optionally saved in a cache directory between runs. A saved
+    listing is used as long as the modification time of the
+    directory it lists has not changed, so checking a directory
+    costs a `stat` rather than a full listing (which makes a
+    difference on network file systems).
+
+    Listing a directory which does not exist gives an empty list.
+
+    :param cache_dir: directory to save listings in (`None` to keep
+                      them in memory only)
+    :type  cache_dir: string
+
+    :param rootdir: corpus directory (there is one set of saved
+                    listings per corpus)
+    :type  rootdir: string
+    """
+    def __init__(self, cache_dir, rootdir):
+        self._path = None
+        self._listings = {}
+        self._dirty = False
+        if cache_dir is not None:
+            root = os.path.abspath(rootdir)
+            digest = hashlib.sha1(root.encode('utf-8')).hexdigest()
+            self._path = os.path.join(cache_dir,
+                                      'listing-' + digest + _SUFFIX)
+            try:
+                with open(self._path, 'rb') as stream:
+                    self._listings = pickle.load(stream)
+            except Exception:  # pylint: disable=broad-except
+                # missing or unreadable: start afresh
+                self._listings = {}
+
+    def listdir(self, path):
+        """
+        Entries in a directory (see `list_dir`)
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return []
+        cached = self._listings.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            entries = list_dir(path)
+        except OSError:  # eg. not a directory
+            entries = []
+        self._listings[path] = (mtime, entries)
+        self._dirty = True
+        return entries
+
+    def save(self):
+        """
+        Save listings to the cache directory (if there is one and
+        they have changed)
+        """
+        if self._path is None or not self._dirty:
+            return
+        cache_dir = os.path.dirname(self._path)
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError as oops:
+                if oops.errno != errno.EEXIST:
+                    raise
+        handle, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as stream:
+            pickle.dump(self._listings, stream, pickle.HIGHEST_PROTOCOL)
+        try:
+            os.rename(tmp_path, self._path)
+        except OSError:
+            ParseCache._remove(self._path)
+            os.rename(tmp_path, self._path)
+        self._dirty = False
@@ -17,9 +17,15 @@ Corpus management
 # the above. Give us a mapping from FileId to filepaths and we
 # do the rest.
 
+from collections import OrderedDict
+import multiprocessing
 import sys
 
-class FileId:
+from six.moves.collections_abc import Mapping
+
+from educe.cache import ParseCache
+
+class FileId(object):
     """
     Information needed to uniquely identify an annotation file.
 
@@ -48,12 +54,21 @@ class FileId:
         generated this annoation file
     :type annotator: string
     """
+    # file ids are used as dictionary keys all over the place, so we
+    # hang on to their tuple form and hash (reset if a field is changed)
+    __slots__ = ('doc', 'subdoc', 'stage', 'annotator', '_key', '_hash')
+
     def __init__(self, doc, subdoc, stage, annotator):
        self.doc=doc
        self.subdoc=subdoc
        self.stage=stage
        self.annotator=annotator
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name[0] != '_':
+            object.__setattr__(self, '_key', None)
+
     def __str__(self):
         return "%s [%s] %s %s" % (self.doc, self.subdoc, self.stage, self.annotator)
 
@@ -62,14 +77,24 @@ class FileId:
         """
         For internal use by __hash__, __eq__, etc
         """
-        return (self.doc, self.subdoc, self.stage, self.annotator)
+        key = self._key
+        if key is None:
+            key = (self.doc, self.subdoc, self.stage, self.annotator)
+            object.__setattr__(self, '_key', key)
+            object.__setattr__(self, '_hash', hash(key))
+        return key
 
     def __hash__(self):
-        return hash(self._tuple())
+        if self._key is None:
+            self._tuple()
+        return self._hash
 
     def __eq__(self, other):
         return self._tuple() == other._tuple()
 
+    def __ne__(self, other):
+        return not self == other
+
     def __lt__(self, other):
         return self._tuple() < other._tuple()
 
@@ -95,6 +120,165 @@ class FileId:
         parts = [self.doc, self.subdoc, local_id]
         return "_".join(p for p in parts if p is not None)
 
+
+_FILEID_FIELDS = ('doc', 'subdoc', 'stage', 'annotator')
+
+
+class Corpus(dict):
+    """
+    Dictionary from `FileId` to documents, as returned by `Reader.slurp`,
+    with an index of its keys by document, subdocument, stage and
+    annotator. This makes questions like "what are the stages of this
+    subdocument" or "which key holds the units stage of this document"
+    dictionary lookups rather than scans over the whole corpus.
+
+    .. code-block:: python
+
+        corpus = reader.slurp()
+        units = corpus.select(doc='pilot14', subdoc='02', stage='units')
+
+    The index is built on first use and discarded whenever keys are
+    added or removed.
+    """
+    def __init__(self, *args, **kwargs):
+        super(Corpus, self).__init__(*args, **kwargs)
+        self._index = None
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._index = None
+        super(Corpus, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._index = None
+        super(Corpus, self).__delitem__(key)
+
+    def clear(self):
+        self._index = None
+        super(Corpus, self).clear()
+
+    def pop(self, *args):
+        self._index = None
+        return super(Corpus, self).pop(*args)
+
+    def popitem(self):
+        self._index = None
+        return super(Corpus, self).popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._index = None
+        return super(Corpus, self).setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        self._index = None
+        super(Corpus, self).update(*args, **kwargs)
+
+    def _get_index(self):
+        "field -> value -> keys with that value"
+        if self._index is None:
+            index = dict((f, {}) for f in _FILEID_FIELDS)
+            for key in self:
+                for field in _FILEID_FIELDS:
+                    index[field].setdefault(getattr(key, field), []).append(key)
+            self._index = index
+        return self._index
+
+    def select(self, **fields):
+        """
+        Keys in this corpus whose fields have the given values, eg.
+        `select(doc='pilot14', stage='discourse')` (`None` being a
+        value like any other, eg. `annotator=None` picks out keys
+        without an annotator)
+
+        :rtype: [FileId]
+        """
+        if not fields:
+            return list(self)
+        index = self._get_index()
+        candidates = None
+        for field, value in fields.items():
+            if field not in index:
+                raise ValueError("Unknown FileId field: %s" % field)
+            keys = index[field].get(value, [])
+            if candidates is None or len(keys) < len(candidates):
+                candidates = keys
+        return [k for k in candidates
+                if all(getattr(k, f) == v for f, v in fields.items())]
+
+    def values_of(self, field, **fields):
+        """
+        Set of values taken by a field among the keys selected by
+        the other arguments (see `select`), eg.
+        `values_of('subdoc', doc='pilot14')` for the subdocuments of
+        a document
+
+        :rtype: frozenset
+        """
+        if not fields:
+            if field not in _FILEID_FIELDS:
+                raise ValueError("Unknown FileId field: %s" % field)
+            return frozenset(self._get_index()[field])
+        return frozenset(getattr(k, field) for k in self.select(**fields))
+
+
+class LazyCorpus(Mapping):
+    """
+    Read-only mapping from `FileId` to documents, which can stand in
+    for the dictionary returned by `Reader.slurp` (see `Reader.open`)
+    when you only need to look at a few documents at a time.
+
+    Documents are parsed when they are first looked up, and only the
+    `max_docs` most recently used ones are kept in memory. Looking up
+    a document that has since been dropped parses it afresh, so any
+    changes you made to it are lost: if you modify documents, slurp
+    them instead.
+
+    Like `Corpus`, this supports `select` and `values_of` queries on
+    its keys (which do not read any documents).
+    """
+    def __init__(self, reader, cfiles, max_docs=16, cache_dir=None):
+        if max_docs < 1:
+            raise ValueError("LazyCorpus needs room for at least one "
+                             "document (max_docs=%d)" % max_docs)
+        self.reader = reader
+        self.max_docs = max_docs
+        self._files = cfiles
+        self._keys = Corpus((k, None) for k in cfiles)
+        self._cache_dir = cache_dir
+        self._docs = OrderedDict()
+
+    def __getitem__(self, key):
+        if key in self._docs:
+            doc = self._docs.pop(key)
+        elif key in self._files:
+            doc = self.reader.slurp_subcorpus({key: self._files[key]},
+                                              cache_dir=self._cache_dir)[key]
+            while len(self._docs) >= self.max_docs:
+                self._docs.popitem(last=False)
+        else:
+            raise KeyError(key)
+        self._docs[key] = doc
+        return doc
+
+    def __contains__(self, key):
+        return key in self._files
+
+    def __iter__(self):
+        return iter(self._files)
+
+    def __len__(self):
+        return len(self._files)
+
+    def select(self, **fields):
+        "See `Corpus.select`"
+        return self._keys.select(**fields)
+
+    def values_of(self, field, **fields):
+        "See `Corpus.values_of`"
+        return self._keys.values_of(field, **fields)
+
+
 class Reader:
     """
     `Reader` provides little more than dictionaries from `FileId`
@@ -139,30 +323,126 @@ class Reader:
         Derived classes
         """
 
-    def slurp(self, cfiles=None, verbose=False):
+    def slurp(self, cfiles=None, verbose=False, workers=None,
+              cache_dir=None):
         """
         Read the entire corpus if `cfiles` is `None` or else the
         subset specified by `cfiles`.
 
-        Return a dictionary from FileId to `educe.Annotation.Document`
+        Return a dictionary (`Corpus`) from FileId to
+        `educe.Annotation.Document`
 
         :param cfiles: a dictionary like what `Corpus.files` would return
         :type  cfiles: dict
 
         :param verbose: print what we're reading to stderr
         :type  verbose: bool
+
+        :param workers: number of processes to parse files with
+                        (`None` or 1 to read them one at a time)
+        :type  workers: int
+
+        :param cache_dir: if set, keep parsed files in this directory
+                          (see `educe.cache`) and reload files which
+                          have not changed from there
+        :type  cache_dir: string
         """
         if cfiles is None:
             subcorpus=self.files()
         else:
             subcorpus=cfiles
-        return self.slurp_subcorpus(subcorpus, verbose)
+        return self.slurp_subcorpus(subcorpus, verbose,
+                                    workers=workers, cache_dir=cache_dir)
 
-    def slurp_subcorpus(self, cfiles, verbose=False):
+    def open(self, cfiles=None, max_docs=16, cache_dir=None):
+        """
+        Like `slurp`, but return a `LazyCorpus`, which only reads
+        documents as you look them up and keeps no more than
+        `max_docs` of them in memory at a time
+
+        :param cfiles: a dictionary like what `Corpus.files` would return
+        :type  cfiles: dict
+
+        :param max_docs: how many parsed documents to keep around
+        :type  max_docs: int
+
+        :param cache_dir: see `slurp`
+        :type  cache_dir: string
+        """
+        if cfiles is None:
+            cfiles = self.files()
+        return LazyCorpus(self, cfiles, max_docs=max_docs,
+                          cache_dir=cache_dir)
+
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
         """
         Derived classes should implement this function
         """
-        return {}
+        return Corpus()
+
+    def _slurp_files(self, read, cfiles, verbose=False, workers=None,
+                     cache_dir=None):
+        """
+        Helper for `slurp_subcorpus`: apply `read` to the value of
+        each key in `cfiles` (unpacking tuples of paths into separate
+        arguments) and return a dictionary from keys to results.
+
+        If `workers` is more than 1, the files are parsed in a pool of
+        that many processes; `read` must then be a module-level
+        function and its results picklable. Either way, keys are
+        inserted in the order of `cfiles` and progress is reported
+        as the results come in.
+
+        If `cache_dir` is set, results for files that were parsed on
+        a previous run are loaded from the cache instead, and new
+        results are saved to it.
+        """
+        keys = list(cfiles.keys())
+        cache = ParseCache(cache_dir) if cache_dir is not None else None
+        cached = {}
+        cache_keys = {}
+        if cache is not None:
+            for k in keys:
+                ckey = cache.key(read, cfiles[k])
+                if ckey is None:
+                    continue
+                cache_keys[k] = ckey
+                value = cache.get(ckey)
+                if value is not None:
+                    cached[k] = value
+        jobs = [(read, cfiles[k]) for k in keys if k not in cached]
+        corpus = Corpus()
+        counter = 0
+        pool = None
+        if workers is not None and workers > 1 and len(jobs) > 1:
+            pool = multiprocessing.Pool(min(workers, len(jobs)))
+            chunksize = max(1, len(jobs) // (4 * workers))
+            results = pool.imap(_read_job, jobs, chunksize)
+        else:
+            results = (_read_job(j) for j in jobs)
+        try:
+            for k in keys:
+                if verbose:
+                    sys.stderr.write("\rSlurping corpus dir [%d/%d]" %
+                                     (counter, len(cfiles)))
+                if k in cached:
+                    corpus[k] = cached[k]
+                else:
+                    corpus[k] = next(results)
+                    if k in cache_keys:
+                        cache.put(cache_keys[k], corpus[k])
+                counter = counter+1
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if cache is not None and jobs:
+            cache.evict()
+        if verbose:
+            sys.stderr.write("\rSlurping corpus dir [%d/%d done]\n" %
+                             (counter, len(cfiles)))
+        return corpus
 
     def filter(self, d, pred):
         """
@@ -172,3 +452,14 @@ class Reader:
         """
         return dict([(k,v) for k,v in d.items() if pred(k)])
 
+
+def _read_job(job):
+    """
+    Read a single corpus entry for `Reader._slurp_files`
+    (module-level so that it can be sent to worker processes)
+    """
+    read, paths = job
+    if isinstance(paths, tuple):
+        return read(*paths)
+    else:
+        return read(paths)
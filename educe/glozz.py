@@ -10,21 +10,21 @@ You're likely most interested in
 """
 
 from __future__ import print_function
-from xml.dom import minidom
 import codecs
 import xml.etree.ElementTree as ET
 import sys
 
+from six.moves import intern
+
 from educe.annotation import (Span, RelSpan, Unit, Relation, Schema,
                               Document)
-from educe.internalutil import on_single_element
+from educe.internalutil import on_single_element, EduceXmlException
 
 
 if sys.version > '3':
     long = int
 
 
-_MINIDOM_ZERO = len(minidom.Document().toxml(encoding='utf-8')) + 1
 _GLOZZ_DECL = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>'
 
 
@@ -153,6 +153,18 @@ class GlozzException(Exception):
 # ---------------------------------------------------------------------
 # glozz files
 # ---------------------------------------------------------------------
+# NB: annotation types, feature names and metadata keys come from a small
+# vocabulary repeated across every annotation in the corpus, so we intern
+# them as we read them rather than keeping a copy per annotation
+def _intern(text):
+    """
+    Intern a string read from the XML, if we can: on Python 2,
+    ElementTree gives us `unicode` for any non-ASCII text, which
+    `intern` does not accept (such strings are returned as is)
+    """
+    return intern(text) if isinstance(text, str) else text
+
+
 def read_node(node, context=None):
     def get_one(name, default, ctx=None):
         f = lambda n: read_node(n, ctx)
@@ -176,7 +188,7 @@ def read_node(node, context=None):
         return (unit_type, fs)
 
     elif node.tag == 'feature':
-        attr = node.attrib['name']
+        attr = _intern(node.attrib['name'])
         val = node.text.strip() if node.text else None
         return (attr, val)
 
@@ -188,7 +200,7 @@ def read_node(node, context=None):
         return node.attrib['corpusHashcode']
 
     elif node.tag == 'metadata':
-        return dict([(t.tag, t.text.strip()) for t in node])
+        return dict([(_intern(t.tag), t.text.strip()) for t in node])
 
     elif node.tag == 'positioning' and context == 'unit':
         start = get_one('start', None)
@@ -235,7 +247,7 @@ def read_node(node, context=None):
         return node.attrib['id']
 
     elif node.tag == 'type':
-        return node.text.strip()
+        return _intern(node.text.strip())
 
     elif node.tag == 'unit':
         unit_id = node.attrib['id']
@@ -245,18 +257,145 @@ def read_node(node, context=None):
         return Unit(unit_id, span, unit_type, fs, metadata=metadata)
 
 
+def _children(node):
+    """
+    Dictionary from tag to the list of children of a node with that
+    tag (one pass over the children instead of a `findall` per tag)
+    """
+    kids = {}
+    for kid in node:
+        kids.setdefault(kid.tag, []).append(kid)
+    return kids
+
+
+_REQUIRED = object()
+
+
+def _single(kids, name, default=_REQUIRED):
+    """
+    The only child with the given name (see `_children`), or the
+    default if there isn't any; same failure modes as
+    `on_single_element`
+    """
+    nodes = kids.get(name)
+    if not nodes:
+        if default is _REQUIRED:
+            raise EduceXmlException("Expected but did not find any nodes "
+                                    "with name %s" % name)
+        return default
+    elif len(nodes) > 1:
+        raise EduceXmlException("Found more than one node with name %s" %
+                                name)
+    return nodes[0]
+
+
+def _read_annotation_parts(kids):
+    """
+    Type, features and metadata of the annotation whose children
+    are `kids`
+    """
+    char_kids = _children(_single(kids, 'characterisation'))
+    anno_type = _intern(_single(char_kids, 'type').text.strip())
+    fs_node = _single(char_kids, 'featureSet', ())
+    features = {}
+    for feat in fs_node:
+        if feat.tag == 'feature':
+            features[_intern(feat.attrib['name'])] =\
+                feat.text.strip() if feat.text else None
+    md_node = _single(kids, 'metadata', ())
+    metadata = dict((_intern(t.tag), t.text.strip()) for t in md_node)
+    return anno_type, features, metadata
+
+
+def _read_position(kids, name):
+    "character offset in a unit <start>/<end> element"
+    pos_kids = _children(_single(kids, name))
+    return int(_single(pos_kids, 'singlePosition').attrib['index'])
+
+
+def _read_unit(node):
+    "Unit from a <unit> element"
+    kids = _children(node)
+    anno_type, features, metadata = _read_annotation_parts(kids)
+    pos_kids = _children(_single(kids, 'positioning'))
+    span = Span(_read_position(pos_kids, 'start'),
+                _read_position(pos_kids, 'end'))
+    return Unit(node.attrib['id'], span, anno_type, features,
+                metadata=metadata)
+
+
+def _read_relation(node):
+    "Relation from a <relation> element"
+    kids = _children(node)
+    anno_type, features, metadata = _read_annotation_parts(kids)
+    terms = [t.attrib['id'] for t in _single(kids, 'positioning')
+             if t.tag == 'term']
+    if len(terms) != 2:
+        raise GlozzException(
+            "Was expecting exactly 2 terms, but got %d" % len(terms))
+    span = RelSpan(terms[0], terms[1])
+    return Relation(node.attrib['id'], span, anno_type, features,
+                    metadata=metadata)
+
+
+def _read_schema(node):
+    "Schema from a <schema> element"
+    kids = _children(node)
+    anno_type, features, metadata = _read_annotation_parts(kids)
+    pos_kids = _children(_single(kids, 'positioning'))
+    units, rels, schemas = [
+        frozenset(x.attrib['id'] for x in pos_kids.get(tag, ()))
+        for tag in ['embedded-unit', 'embedded-relation', 'embedded-schema']]
+    return Schema(node.attrib['id'], units, rels, schemas,
+                  anno_type, features, metadata=metadata)
+
+
+_READERS = {'unit': _read_unit,
+            'relation': _read_relation,
+            'schema': _read_schema}
+
+
 def read_annotation_file(anno_filename, text_filename=None):
     """
     Read a single glozz annotation file and its corresponding text
     (if any).
     """
-    tree = ET.parse(anno_filename)
-    (hashcode, units, rels, schemas) = read_node(tree.getroot())
+    # Single pass over the file: annotations are built as soon as
+    # their element is complete, and then dropped from the tree so
+    # that we never hold more than a handful of them in XML form.
+    # Only the direct children of the root count (as with `read_node`)
+    found = {'unit': [], 'relation': [], 'schema': []}
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(anno_filename, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag in _READERS:
+            found[elem.tag].append(_READERS[elem.tag](elem))
+            root.remove(elem)
+    if root.tag != 'annotations':
+        raise GlozzException("Expected <annotations> root element in %s" %
+                             anno_filename)
+    md_node = _single(_children(root), 'metadata', None)
+    hashcode = md_node.attrib['corpusHashcode'] if md_node is not None\
+        else None
     text = None
     if text_filename is not None:
-        with codecs.open(text_filename, 'r', 'utf-8') as tf:
-            text = tf.read()
-    return GlozzDocument(hashcode, units, rels, schemas, text)
+        text = read_text_file(text_filename)
+    return GlozzDocument(hashcode or None, found['unit'], found['relation'],
+                         found['schema'], text)
+
+
+def read_text_file(text_filename):
+    """
+    Read the text (.ac) file that goes with a glozz annotation file
+    """
+    with codecs.open(text_filename, 'r', 'utf-8') as tf:
+        return tf.read()
 
 
 def hashcode(f):
@@ -278,24 +417,109 @@ def hashcode(f):
     return str(length) + '-' + str(code)
 
 
+# Glozz XML is written out line by line, one element per line, which is
+# what we used to get by pretty-printing the ElementTree output through
+# minidom (`toprettyxml(indent="")`), minus the cost of serialising and
+# reparsing the whole document. To stay diff-stable with files written
+# that way (and with Glozz itself)
+#
+# * elements with no children (and no text) are written `<tag/>`
+# * text-only elements are written on a single line
+# * newlines are dropped from text values
+# * `&`, `<`, `>` and `"` are escaped in both text and attribute values
+
+
+def _escape(text):
+    "escape a text or attribute value as minidom would"
+    return text.replace('&', '&amp;').replace('<', '&lt;')\
+        .replace('"', '&quot;').replace('>', '&gt;')
+
+
+def _empty_tag(tag, attr=None):
+    "line for a childless element (with up to one attribute)"
+    if attr is None:
+        return '<%s/>' % tag
+    return '<%s %s="%s"/>' % (tag, attr[0], _escape(attr[1]))
+
+
+def _text_tag(tag, text, attr=None):
+    "line for a text-only element (with up to one attribute)"
+    text = text.replace('\n', '') if text else ''
+    if not text:
+        return _empty_tag(tag, attr)
+    start = tag if attr is None else\
+        '%s %s="%s"' % (tag, attr[0], _escape(attr[1]))
+    return '<%s>%s</%s>' % (start, _escape(text), tag)
+
+
+def _parent_lines(tag, children, attr=None):
+    "lines for an element given the lines of its children"
+    if not children:
+        return [_empty_tag(tag, attr)]
+    start = _empty_tag(tag, attr)[:-2] + '>'
+    return [start] + children + ['</%s>' % tag]
+
+
+def _glozz_annotation_lines(anno, tag, settings):
+    """
+    Glozz XML for an annotation as a list of lines, in the same
+    order as `glozz_annotation_to_xml`
+    """
+    meta = [_text_tag(k, anno.metadata[k])
+            for k in ordered_keys(settings.md_order, anno.metadata)]
+    feats = [_text_tag('feature', anno.features[k], attr=('name', k))
+             for k in ordered_keys(settings.fs_order, anno.features)]
+    char = [_text_tag('type', anno.type)] +\
+        _parent_lines('featureSet', feats)
+
+    if tag == 'unit':
+        span = anno.span
+        pos = (_parent_lines('start',
+                             [_empty_tag('singlePosition',
+                                         ('index', str(span.char_start)))]) +
+               _parent_lines('end',
+                             [_empty_tag('singlePosition',
+                                         ('index', str(span.char_end)))]))
+    elif tag == 'relation':
+        pos = [_empty_tag('term', ('id', str(anno.span.t1))),
+               _empty_tag('term', ('id', str(anno.span.t2)))]
+    elif tag == 'schema':
+        pos = ([_empty_tag('embedded-unit', ('id', str(x)))
+                for x in sorted(anno.units)] +
+               [_empty_tag('embedded-relation', ('id', str(x)))
+                for x in sorted(anno.relations)] +
+               [_empty_tag('embedded-schema', ('id', str(x)))
+                for x in sorted(anno.schemas)])
+    else:
+        raise Exception("Don't know how to emit XML for non unit/relation annotations (%s)" % tag)
+
+    return _parent_lines(tag,
+                         _parent_lines('metadata', meta) +
+                         _parent_lines('characterisation', char) +
+                         _parent_lines('positioning', pos),
+                         attr=('id', anno.local_id()))
+
+
 def write_annotation_file(anno_filename, doc,
                           settings=DEFAULT_OUTPUT_SETTINGS):
     """
     Write a GlozzDocument to XML in the given path
     """
-    elem = doc.to_xml(settings=settings)
-    string1 = ET.tostring(elem, encoding='utf-8')
-    # contortion 1: write, then read and print from minidom to match
-    # whitespace on closing tags (we're trying to match glozz output
-    # as much as possible so as to avoid introducing spurious
-    # differences when automatically rewriting glozz data files)
-    reparsed = minidom.parseString(string1.replace('\n', ''))
-    string2 = reparsed.toprettyxml(indent="", encoding='utf-8')
-    # contortion 2: chop off XML declaration and use one which more
-    # closely matches Glozz
     with codecs.open(anno_filename, 'wb', 'utf-8') as fout:
         print(_GLOZZ_DECL, file=fout)
-        # we have to decode('utf-8') first, because
-        # codecs expects Unicode strings to encode them to UTF-8
-        out_str = string2[_MINIDOM_ZERO:].decode('utf-8')
-        fout.write(out_str)
+        if not (doc.hashcode is not None or doc.units or doc.relations or
+                doc.schemas):
+            print(_empty_tag('annotations'), file=fout)
+            return
+        print('<annotations>', file=fout)
+        if doc.hashcode is not None:
+            print(_empty_tag('metadata', ('corpusHashcode', doc.hashcode)),
+                  file=fout)
+        for tag, annos in [('unit', doc.units),
+                           ('relation', doc.relations),
+                           ('schema', doc.schemas)]:
+            for anno in annos:
+                fout.write('\n'.join(_glozz_annotation_lines(anno, tag,
+                                                              settings)))
+                fout.write('\n')
+        print('</annotations>', file=fout)
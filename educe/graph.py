@@ -95,15 +95,15 @@ Classes
 """
 
 from __future__ import print_function
-import copy
+import bisect
 import collections
+import itertools
 import subprocess
 import textwrap
 
 import pydot
-import pygraph.classes.hypergraph as gr
 import pygraph.classes.digraph    as dgr
-from pygraph.algorithms import accessibility
+from pygraph.classes.exceptions import AdditionError
 
 # pylint: disable=too-few-public-methods, star-args
 
@@ -194,7 +194,351 @@ class AttrsMixin():
         else:
             return self.mirror(x)
 
-class Graph(gr.hypergraph, AttrsMixin):
+class _Hypergraph(object):
+    """
+    Nodes, hyperedges, links between the two, and attributes on both.
+
+    This works like the parts of python-graph's `hypergraph` that we
+    use (same method names, same errors), but the adjacency is kept in
+    dictionaries from each node/edge to its links, the attributes in a
+    dictionary per node/edge, and the nodes and edges are indexed by
+    their 'type' attribute. Links are listed in the order they were
+    made (this matters for relations, see `Graph.rel_links`)
+    """
+    def __init__(self):
+        self._node_links = {}
+        self._edge_links = {}
+        self._linked = set()
+        self._node_attrs = {}
+        self._edge_attrs = {}
+        self._nodes_by_type = collections.defaultdict(set)
+        self._edges_by_type = collections.defaultdict(set)
+        # True if our link lists and attribute dicts may be shared
+        # with another graph (see `_subgraph`)
+        self._shared = False
+
+    def __eq__(self, other):
+        """
+        Same nodes, edges, links and attributes (as in python-graph,
+        the order of the links does not matter)
+        """
+        if not isinstance(other, _Hypergraph):
+            return False
+        if set(self._node_links) != set(other._node_links) or\
+                set(self._edge_links) != set(other._edge_links):
+            return False
+        for edge, links in self._edge_links.items():
+            if set(links) != set(other._edge_links[edge]):
+                return False
+        return self._node_attrs == other._node_attrs and\
+            self._edge_attrs == other._edge_attrs
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __iter__(self):
+        return iter(self.nodes())
+
+    def __len__(self):
+        return len(self._node_links)
+
+    def __getitem__(self, node):
+        return self.neighbors(node)
+
+    def order(self):
+        """
+        Number of nodes in the graph
+        """
+        return len(self._node_links)
+
+    def nodes(self):
+        """
+        List of nodes in the graph
+        """
+        return list(self._node_links)
+
+    def hyperedges(self):
+        """
+        List of hyperedges in the graph
+        """
+        return list(self._edge_links)
+
+    def edges(self):
+        """
+        Same as `hyperedges`
+        """
+        return self.hyperedges()
+
+    def has_node(self, node):
+        return node in self._node_links
+
+    def has_edge(self, hyperedge):
+        return hyperedge in self._edge_links
+
+    def has_hyperedge(self, hyperedge):
+        return hyperedge in self._edge_links
+
+    def links(self, obj):
+        """
+        Nodes linked to a hyperedge, or hyperedges linked to a node
+        (if the id is that of both an edge and a node, it is taken to
+        be the edge)
+        """
+        if obj in self._edge_links:
+            return self._edge_links[obj]
+        else:
+            return self._node_links[obj]
+
+    def neighbors(self, obj):
+        """
+        Nodes which share a hyperedge with the given node, in the
+        order we first come across them going through its links
+        """
+        seen = set([obj])
+        res = []
+        for edge in self._node_links[obj]:
+            for node in self._edge_links[edge]:
+                if node not in seen:
+                    seen.add(node)
+                    res.append(node)
+        return res
+
+    def _changed(self):
+        """
+        Called whenever a node, edge, link or attribute is added or
+        removed (for subclasses that keep indexes over the graph)
+        """
+        pass
+
+    def _subgraph(self, nodes, edges):
+        """
+        Graph of the same class with only the given nodes and edges
+        (the edges must only link to the given nodes; nodes that are
+        not in this graph are ignored). Nodes and edges are added in
+        the order they are given.
+
+        This does not copy any link lists or attributes: they are
+        shared between the two graphs until either is modified
+        (see `_own`), so the cost is that of the subset, not of the
+        whole graph
+        """
+        sub = self.__class__()
+        edge_set = frozenset(edges)
+        for node in nodes:
+            links = self._node_links.get(node)
+            if links is None:
+                continue
+            kept = [e for e in links if e in edge_set]
+            sub._node_links[node] = links if len(kept) == len(links)\
+                else kept
+            attrs = self._node_attrs[node]
+            sub._node_attrs[node] = attrs
+            if 'type' in attrs:
+                sub._nodes_by_type[attrs['type']].add(node)
+        for edge in edges:
+            sub._edge_links[edge] = self._edge_links[edge]
+            attrs = self._edge_attrs[edge]
+            sub._edge_attrs[edge] = attrs
+            if 'type' in attrs:
+                sub._edges_by_type[attrs['type']].add(edge)
+        sub._linked = None
+        sub._shared = True
+        self._shared = True
+        return sub
+
+    def _own(self):
+        """
+        Make private copies of any link lists and attributes we might
+        be sharing with another graph (called before modifying them)
+        """
+        if not self._shared:
+            return
+        self._node_links = dict((k, list(v))
+                                for k, v in self._node_links.items())
+        self._edge_links = dict((k, list(v))
+                                for k, v in self._edge_links.items())
+        self._node_attrs = dict((k, dict(v))
+                                for k, v in self._node_attrs.items())
+        self._edge_attrs = dict((k, dict(v))
+                                for k, v in self._edge_attrs.items())
+        if self._linked is None:
+            self._linked = set((n, e) for e, links in self._edge_links.items()
+                               for n in links)
+        self._shared = False
+
+    def add_node(self, node):
+        if node in self._node_links:
+            raise AdditionError("Node %s already in graph" % node)
+        self._node_links[node] = []
+        self._node_attrs[node] = {}
+        self._changed()
+
+    def _add_node_with_attrs(self, node, attrs):
+        """
+        Add a node along with its (key, value) attributes in one go,
+        rather than one `add_node_attribute` call per attribute
+        """
+        if node in self._node_links:
+            raise AdditionError("Node %s already in graph" % node)
+        attrs = dict(attrs)
+        self._node_links[node] = []
+        self._node_attrs[node] = attrs
+        if 'type' in attrs:
+            self._nodes_by_type[attrs['type']].add(node)
+        self._changed()
+
+    def add_nodes(self, nodelist):
+        for node in nodelist:
+            self.add_node(node)
+
+    def add_hyperedge(self, hyperedge):
+        if hyperedge not in self._edge_links:
+            self._edge_links[hyperedge] = []
+            self._edge_attrs[hyperedge] = {}
+            self._changed()
+
+    def _add_edge_with_attrs(self, hyperedge, attrs):
+        """
+        Add a (new) hyperedge along with its (key, value) attributes in
+        one go
+        """
+        attrs = dict(attrs)
+        self._edge_links[hyperedge] = []
+        self._edge_attrs[hyperedge] = attrs
+        if 'type' in attrs:
+            self._edges_by_type[attrs['type']].add(hyperedge)
+        self._changed()
+
+    def add_edge(self, hyperedge):
+        self.add_hyperedge(hyperedge)
+
+    def add_hyperedges(self, edgelist):
+        for edge in edgelist:
+            self.add_hyperedge(edge)
+
+    def add_edges(self, edgelist):
+        self.add_hyperedges(edgelist)
+
+    def del_node(self, node):
+        if node not in self._node_links:
+            return
+        self._own()
+        for edge in self._node_links.pop(node):
+            self._edge_links[edge].remove(node)
+            self._linked.discard((node, edge))
+        attrs = self._node_attrs.pop(node)
+        if 'type' in attrs:
+            self._nodes_by_type[attrs['type']].discard(node)
+        self._changed()
+
+    def del_hyperedge(self, hyperedge):
+        if hyperedge not in self._edge_links:
+            return
+        self._own()
+        for node in self._edge_links.pop(hyperedge):
+            self._node_links[node].remove(hyperedge)
+            self._linked.discard((node, hyperedge))
+        attrs = self._edge_attrs.pop(hyperedge)
+        if 'type' in attrs:
+            self._edges_by_type[attrs['type']].discard(hyperedge)
+        self._changed()
+
+    def del_edge(self, hyperedge):
+        self.del_hyperedge(hyperedge)
+
+    def link(self, node, hyperedge):
+        self._own()
+        if (node, hyperedge) in self._linked:
+            raise AdditionError("Link (%s, %s) already in graph" %
+                                (node, hyperedge))
+        self._edge_links[hyperedge].append(node)
+        self._node_links[node].append(hyperedge)
+        self._linked.add((node, hyperedge))
+        self._changed()
+
+    def unlink(self, node, hyperedge):
+        self._own()
+        self._node_links[node].remove(hyperedge)
+        self._edge_links[hyperedge].remove(node)
+        self._linked.discard((node, hyperedge))
+        self._changed()
+
+    def rank(self):
+        """
+        Largest number of nodes linked to a hyperedge
+        """
+        return max([len(x) for x in self._edge_links.values()] or [0])
+
+    @staticmethod
+    def _set_attr(attrs, by_type, obj, attr):
+        """
+        Set a (key, value) attribute, keeping the type index up to date
+        """
+        key, value = attr
+        if key == 'type':
+            if 'type' in attrs:
+                by_type[attrs['type']].discard(obj)
+            by_type[value].add(obj)
+        attrs[key] = value
+
+    def add_node_attribute(self, node, attr):
+        self._own()
+        self._set_attr(self._node_attrs[node], self._nodes_by_type,
+                       node, attr)
+        self._changed()
+
+    def add_node_attributes(self, node, attrs):
+        self._own()
+        for attr in attrs:
+            self._set_attr(self._node_attrs[node], self._nodes_by_type,
+                           node, attr)
+        self._changed()
+
+    def add_edge_attribute(self, edge, attr):
+        self._own()
+        self._set_attr(self._edge_attrs[edge], self._edges_by_type,
+                       edge, attr)
+        self._changed()
+
+    def add_edge_attributes(self, edge, attrs):
+        self._own()
+        for attr in attrs:
+            self._set_attr(self._edge_attrs[edge], self._edges_by_type,
+                           edge, attr)
+        self._changed()
+
+    def node_attributes(self, node):
+        """
+        List of (key, value) attributes of a node
+        """
+        return list(self._node_attrs[node].items())
+
+    def edge_attributes(self, edge):
+        """
+        List of (key, value) attributes of an edge
+        """
+        return list(self._edge_attrs[edge].items())
+
+    def node_attributes_dict(self, node):
+        return dict(self._node_attrs[node])
+
+    def edge_attributes_dict(self, edge):
+        return dict(self._edge_attrs[edge])
+
+    def nodes_of_type(self, ntype):
+        """
+        Set of nodes whose 'type' attribute is `ntype`
+        """
+        return frozenset(self._nodes_by_type.get(ntype, ()))
+
+    def edges_of_type(self, etype):
+        """
+        Set of edges whose 'type' attribute is `etype`
+        """
+        return frozenset(self._edges_by_type.get(etype, ()))
+
+
+class Graph(_Hypergraph, AttrsMixin):
     """
     Hypergraph representation of discourse structure.
     See the section on Educe hypergraphs_
@@ -226,7 +570,18 @@ class Graph(gr.hypergraph, AttrsMixin):
 
     def __init__(self):
         AttrsMixin.__init__(self)
-        gr.hypergraph.__init__(self)
+        _Hypergraph.__init__(self)
+        self._changed()
+
+    def _changed(self):
+        # indexes built on demand by containing_cdu, containing_cdu_chain,
+        # cdu_members, connected_components and copy; any change to the
+        # graph invalidates them
+        self._containing_cdus = None
+        self._cdu_chains = {}
+        self._deep_members = {}
+        self._components = None
+        self._linkless_edges = None
 
     @classmethod
     def from_doc(cls, corpus, doc_key,
@@ -260,42 +615,32 @@ class Graph(gr.hypergraph, AttrsMixin):
         grph.doc_key = doc_key
         grph.doc = doc
 
-        # objects that are pointed to by a relations or schemas
-        included = []
-        included.extend(x.local_id() for x in doc.units
-                        if could_include(x))
-        for anno in doc.relations:
-            if pred(anno):
-                included.extend([anno.span.t1, anno.span.t2])
-        for anno in doc.schemas:
-            if pred(anno):
-                included.extend(anno.span)
-
-        nodes = []
-        edges = []
-
-        edus = [x for x in doc.units   if x.local_id() in included and pred(x)]
         rels = [x for x in doc.relations if pred(x)]
-        cdus = [s for s in doc.schemas if pred(s)]
+        cdus = [x for x in doc.schemas if pred(x)]
 
-        nodes.extend(grph._unit_node(x) for x in edus)
+        # objects that are pointed to by a relations or schemas
+        included = set(x.local_id() for x in doc.units if could_include(x))
+        for anno in rels:
+            included.add(anno.span.t1)
+            included.add(anno.span.t2)
+        for anno in cdus:
+            included.update(anno.span)
+        edus = [x for x in doc.units if x.local_id() in included and pred(x)]
+
+        nodes = [grph._unit_node(x) for x in edus]
         nodes.extend(grph._rel_node(x) for x in rels)
-        nodes.extend(grph._schema_node(x)for x in cdus)
-        edges.extend(grph._rel_edge(x) for x in rels)
+        nodes.extend(grph._schema_node(x) for x in cdus)
+        edges = [grph._rel_edge(x) for x in rels]
         edges.extend(grph._schema_edge(x) for x in cdus)
 
         for node, attrs in nodes:
-            if not grph.has_node(node):
-                grph.add_node(node)
-                for anno in attrs.items():
-                    grph.add_node_attribute(node, anno)
-            else:
+            if grph.has_node(node):
                 raise DuplicateIdException(node)
+            grph._add_node_with_attrs(node, attrs)
 
         for edge, attrs, links in edges:
             if not grph.has_edge(edge):
-                grph.add_edge(edge)
-                grph.add_edge_attributes(edge, attrs.items())
+                grph._add_edge_with_attrs(edge, attrs)
                 for lnk in links:
                     grph.link(lnk, edge)
 
@@ -320,56 +665,80 @@ class Graph(gr.hypergraph, AttrsMixin):
 
         This is a shallow copy in the sense that the underlying
         layer of annotations and documents remains the same.
+        Moreover, the copy shares its links and attributes with
+        this graph until one of the two is modified, and only the
+        edges linked to the subset are looked at, so taking many
+        copies of parts of a large graph (eg. one for each
+        dialogue) costs little more than the parts themselves.
 
         :param nodeset: only copy nodes with these names
         :type  nodeset: iterable of strings
         """
-        g = self.__class__()
-        g.corpus = self.corpus
-        g.doc_key = self.doc_key
-        g.doc = self.doc
-
         if nodeset is None:
-            nodes_wanted = set(self.nodes())
+            node_order = list(self._node_links)
         else:
-            nodes_wanted = set(nodeset)
+            node_order = list(nodeset)
+        nodes_wanted = set(node_order)
 
-        cdus = [ x for x in nodes_wanted if self.is_cdu(x) ]
+        cdus = [ x for x in node_order if self.is_cdu(x) ]
         for x in cdus:
-            nodes_wanted.update(self.cdu_members(x, deep=True))
-
-        def is_wanted_edge(e):
-            return all([l in nodes_wanted for l in self.links(e)])
+            for member in self.cdu_members(x, deep=True):
+                if member not in nodes_wanted:
+                    nodes_wanted.add(member)
+                    node_order.append(member)
 
-        # keep expanding the copyable edge list until we've
+        # keep expanding the copyable edge set until we've
         # covered everything that exclusively points
-        # (indirectly or otherwise) to our copy set
-        keep_growing = True
-        edges_remaining = self.hyperedges()
-        edges_wanted = set()
-        while keep_growing:
-            keep_growing = False
-            for e in edges_remaining:
-                if is_wanted_edge(e):
-                    edges_wanted.add(e)
-                    nodes_wanted.add(self.mirror(e)) # obligatory node mirror
-                    edges_remaining.remove(e)
-                    keep_growing = True
-
-        for n in self.nodes():
-            if n in nodes_wanted:
-                g.add_node(n)
-                for kv in self.node_attributes(n):
-                    g.add_node_attribute(n,kv)
-
-        for e in self.hyperedges():
-            if e in edges_wanted:
-                g.add_hyperedge(e)
-                for kv in self.edge_attributes(e):
-                    g.add_edge_attribute(e,kv)
-                for l in self.links(e):
-                    g.link(l,e)
-
+        # (indirectly or otherwise) to our copy set: an edge
+        # is wanted once all of its links are, which in turn
+        # makes its (obligatory) node mirror wanted.
+        # Only the edges linked to a wanted node can ever be
+        # wanted, so we only count missing links for those, as
+        # we reach them
+        missing = {}
+        ready = []
+
+        def reach(edge):
+            "start counting the missing links of an edge"
+            missing[edge] = len([l for l in self._edge_links[edge]
+                                 if l not in nodes_wanted])
+            if not missing[edge]:
+                ready.append(edge)
+
+        for n in node_order:
+            for e in self._node_links.get(n, ()):
+                if e not in missing:
+                    reach(e)
+        # edges without links (eg. empty CDUs) go into every copy
+        if self._linkless_edges is None:
+            self._linkless_edges = [e for e, links in self._edge_links.items()
+                                    if not links]
+        for e in self._linkless_edges:
+            reach(e)
+        edge_order = []
+        while ready:
+            e = ready.pop()
+            edge_order.append(e)
+            n = self.mirror(e)
+            if n in nodes_wanted or n not in self._node_links:
+                continue
+            nodes_wanted.add(n)
+            node_order.append(n)
+            links = self._node_links[n]
+            fresh = [e2 for e2 in links if e2 not in missing]
+            for e2 in links:
+                if e2 in missing:
+                    missing[e2] -= 1
+                    if not missing[e2]:
+                        ready.append(e2)
+            for e2 in fresh:
+                if e2 not in missing:
+                    reach(e2)
+
+        g = self._subgraph(node_order, edge_order)
+        g.corpus = self.corpus
+        g.doc_key = self.doc_key
+        g.doc = self.doc
         return g
 
     def connected_components(self):
@@ -379,50 +748,53 @@ class Graph(gr.hypergraph, AttrsMixin):
         Each connected component set can be passed to `self.copy()`
         to be copied as a subgraph.
 
-        This builds on python-graph's version of a function with the
-        same name but also adds awareness of our conventions about there
+        This starts from the usual connected components of the
+        hypergraph but also adds awareness of our conventions about there
         being both a node/edge for relations/CDUs.
         """
-        ccs = accessibility.connected_components(self)
+        if self._components is not None:
+            return self._components
+
+        # union-find over the nodes: nodes sharing an edge are
+        # connected, and so (by our node/edge mirroring convention)
+        # is the mirror node of that edge
+        parent = dict((n, n) for n in self._node_links)
+
+        def find(x):
+            "root of x's set, compressing the path on the way"
+            root = x
+            while parent[root] != root:
+                root = parent[root]
+            while parent[x] != root:
+                parent[x], x = root, parent[x]
+            return root
+
+        for edge, links in self._edge_links.items():
+            mirror = self._edge_attrs[edge].get('mirror')
+            members = list(links)
+            if mirror in parent:
+                members.append(mirror)
+            if not members:
+                continue
+            root = find(members[0])
+            for node in members[1:]:
+                other = find(node)
+                if other != root:
+                    parent[other] = root
+
         subgraphs = collections.defaultdict(set)
-        for node, i in ccs.items():
-            subgraphs[i].add(node)
-
-        # the basic idea here: if any member of connected component is
-        # one of our hybrid node/edge creatures, we need to help the
-        # graph library recognise that that anything connected *via*
-        # the edge should also be considered as connected *to* the
-        # edge, so we merge the components
-        eaten = set()
-        merged = {}
-        prior = subgraphs.keys()
-        while sorted(merged.keys()) != prior:
-            prior = sorted(merged.keys())
-            merged = {}
-            for k in subgraphs:
-                if k in eaten:
-                    continue
-                subg = subgraphs[k]
-                merged[k] = copy.copy(subg)
-                for n in subg:
-                    e = self.mirror(n)
-                    if e is not None:
-                        links = set(self.links(e))
-                        for k2 in subgraphs.keys():
-                            links2 = subgraphs[k2]
-                            if k2 != k and not links2.isdisjoint(links):
-                                eaten.add(k2)
-                                merged[k] |= links2
-            subgraphs = merged
-
-        ccs = frozenset([frozenset(v) for v in subgraphs.values()])
-        return ccs
+        for node in parent:
+            subgraphs[find(node)].add(node)
+        self._components = frozenset(frozenset(v)
+                                     for v in subgraphs.values())
+        return self._components
 
     def _attrs(self, x):
-        if self.has_edge(x):
-            return self.edge_attributes_dict(x)
-        elif self.has_node(x):
-            return self.node_attributes_dict(x)
+        # read-only view: no need to copy
+        if x in self._edge_attrs:
+            return self._edge_attrs[x]
+        elif x in self._node_attrs:
+            return self._node_attrs[x]
         else:
             raise Exception('Tried to get attributes of non-existing object ' + str(x))
 
@@ -432,15 +804,15 @@ class Graph(gr.hypergraph, AttrsMixin):
         By convention, the first link is considered the source and the
         the second is considered the target.
         """
-        return frozenset(e for e in self.hyperedges()
-                         if self.is_relation(e))
+        return frozenset(x for x in self.edges_of_type('rel')
+                         if self.is_relation(x))
 
     def edus(self):
         """
         Set of nodes representing elementary discourse units
         """
-        return frozenset(e for e in self.nodes()
-                         if self.is_edu(e))
+        return frozenset(x for x in self.nodes_of_type('EDU')
+                         if self.is_edu(x))
 
     def cdus(self):
         """
@@ -448,8 +820,8 @@ class Graph(gr.hypergraph, AttrsMixin):
 
         See also `cdu_members`
         """
-        return frozenset(e for e in self.hyperedges()
-                         if self.is_cdu(e))
+        return frozenset(x for x in self.edges_of_type('CDU')
+                         if self.is_cdu(x))
 
     def rel_links(self, edge):
         """
@@ -474,10 +846,15 @@ class Graph(gr.hypergraph, AttrsMixin):
         If there is more than one containing CDU, return one of them
         arbitrarily.
         """
-        for node in self.links(self.nodeform(node)):
-            if self.is_cdu(node):
-                return node
-        return None
+        if self._containing_cdus is None:
+            index = {}
+            for member in self._node_links:
+                for link in self.links(member):
+                    if self.is_cdu(link):
+                        index[member] = link
+                        break
+            self._containing_cdus = index
+        return self._containing_cdus.get(self.nodeform(node))
 
     def containing_cdu_chain(self, node):
         """
@@ -485,12 +862,15 @@ class Graph(gr.hypergraph, AttrsMixin):
         containing CDU, the container's container, and forth.
         Return the empty list if no CDU contains this one.
         """
-        res = []
-        while node:
-            node = self.nodeform(node)
-            res.append(node)
-            node = self.containing_cdu(node)
-        return res[1:]  # drop the node itself
+        if node not in self._cdu_chains:
+            res = []
+            cur = node
+            while cur:
+                cur = self.nodeform(cur)
+                res.append(cur)
+                cur = self.containing_cdu(cur)
+            self._cdu_chains[node] = tuple(res[1:])  # drop the node itself
+        return list(self._cdu_chains[node])
 
     def cdu_members(self, cdu, deep=False):
         """
@@ -503,14 +883,16 @@ class Graph(gr.hypergraph, AttrsMixin):
         """
 
         hyperedge = self.edgeform(cdu)
-        members = set(self.links(hyperedge))
+        if not deep:
+            return frozenset(self.links(hyperedge))
 
-        if deep:
+        if hyperedge not in self._deep_members:
+            members = set(self.links(hyperedge))
             for m in list(members):
                 if self.is_cdu(m):
-                    members.update(self.cdu_members(m, deep=deep))
-
-        return frozenset(members)
+                    members.update(self.cdu_members(m, deep=True))
+            self._deep_members[hyperedge] = frozenset(members)
+        return self._deep_members[hyperedge]
 
     def _mk_guid(self, x):
         return self.doc_key.mk_global_id(x)
@@ -898,6 +1280,58 @@ class DotGraph(pydot.Dot):
 # enclosure graphs
 # ---------------------------------------------------------------------
 
+class _RankSet(object):
+    """
+    Set of ranks (integers from 0 to `size`, exclusive), as a Fenwick
+    tree of membership counts: adding, removing and finding the next
+    member all take O(log size) steps
+    """
+    def __init__(self, size):
+        self._size = size
+        self._tree = [0] * (size + 1)
+        self._top = 1 << (size.bit_length() - 1) if size else 0
+
+    def _update(self, rank, delta):
+        i = rank + 1
+        while i <= self._size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def add(self, rank):
+        "add a rank (which must not already be in the set)"
+        self._update(rank, 1)
+
+    def discard(self, rank):
+        "remove a rank (which must be in the set)"
+        self._update(rank, -1)
+
+    def _count_below(self, rank):
+        "number of members smaller than `rank`"
+        total = 0
+        i = rank
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def _nth(self, n):
+        "the member with `n` smaller members"
+        i = 0
+        step = self._top
+        while step:
+            nxt = i + step
+            if nxt <= self._size and self._tree[nxt] <= n:
+                i = nxt
+                n -= self._tree[nxt]
+            step >>= 1
+        return i
+
+    def members(self, lo, hi):
+        "members from `lo` (inclusive) to `hi` (exclusive), in order"
+        return [self._nth(n) for n in
+                range(self._count_below(lo), self._count_below(hi))]
+
+
 class EnclosureGraph(dgr.digraph, AttrsMixin):
     """
     Caching mechanism for span enclosure. Given an iterable of Annotation,
@@ -933,9 +1367,20 @@ class EnclosureGraph(dgr.digraph, AttrsMixin):
         self._build_enclosure_graph(annotations, key)
 
     def _build_enclosure_graph(self, annotations, key=None):
+        # we go through the annotations in order of width, connecting
+        # each one to any narrower (or same width) annotations that are
+        # not yet enclosed by anything. Only the narrow annotations that
+        # could overlap the wider one are visited: an annotation that
+        # starts more than `width` characters before another of this
+        # width cannot overlap it, so we rank all annotations by start
+        # point once, keep the narrow ones in a `_RankSet`, and visit
+        # those in the rank range that matters, in the order they
+        # became narrow
+        #
         # text spans can be expensive to compute if there
         # are nested elements; cache them to avoid
         # recomputation
+        annotations = list(annotations)
         spans = {}
         for anno in annotations:
             spans[anno] = anno.text_span()
@@ -974,25 +1419,40 @@ class EnclosureGraph(dgr.digraph, AttrsMixin):
                     kid = self.annotation(id_kid)
                     connect_to_enclosed(mega, kid)
 
-        of_width = collections.defaultdict(list)
         for anno in annotations:
             node, attrs = self._mk_node(anno)
             self.add_node(node)
             for pair in attrs.items():
                 self.add_node_attribute(node, pair)
-            of_width[spans[anno].length()].append(anno)
-
-        narrow = []
-        for width in sorted(of_width):
-            mk_hidden = []
-            layer = of_width[width]
-            narrow.extend(layer)
-            for mega in layer:
-                for mini in narrow:
+
+        # position: place in the order in which annotations become
+        # narrow (by width); rank: place in the order of start points
+        by_width = sorted(annotations, key=lambda x: spans[x].length())
+        ranked = sorted(range(len(by_width)),
+                        key=lambda i: (spans[by_width[i]].char_start, i))
+        starts = [spans[by_width[i]].char_start for i in ranked]
+        rank_of = [0] * len(ranked)
+        for rank, pos in enumerate(ranked):
+            rank_of[pos] = rank
+        narrow = _RankSet(len(ranked))
+
+        for width, layer in itertools.groupby(
+                enumerate(by_width), key=lambda x: spans[x[1]].length()):
+            layer = list(layer)
+            hidden = set()
+            for pos, _ in layer:
+                narrow.add(rank_of[pos])
+            for _, mega in layer:
+                span = spans[mega]
+                lo = bisect.bisect_left(starts, span.char_start - width)
+                hi = bisect.bisect_right(starts, span.char_end)
+                for pos in sorted(ranked[r] for r in narrow.members(lo, hi)):
+                    mini = by_width[pos]
                     connect_to_enclosed(mega, mini)
                     if can_enclose(mega, mini):
-                        mk_hidden.append(mini)
-            narrow = [x for x in narrow if x not in mk_hidden]
+                        hidden.add(pos)
+            for pos in hidden:
+                narrow.discard(rank_of[pos])
 
     def _mk_node_id(self, anno):
         return anno.local_id()
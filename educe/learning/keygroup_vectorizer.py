@@ -46,7 +46,7 @@ class KeyGroupVectorizer(object):
 
         # build a feature count matrix out of feature_acc and row_ptr
         X = []
-        for i in xrange(len(row_ptr) - 1):
+        for i in range(len(row_ptr) - 1):
             current_row, next_row = row_ptr[i], row_ptr[i + 1]
             x = feature_acc[current_row:next_row]
             X.append(x)
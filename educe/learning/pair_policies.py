@@ -0,0 +1,144 @@
+"""
+Policies for pruning the candidate EDU pairs of a document (or dialogue)
+before they are featurised.
+
+Enumerating every ordered pair of EDUs gives a number of instances that
+grows quadratically with the length of the document, even though nearly
+all gold attachments are short-range. A policy decides whether to keep
+a candidate pair from the positions of its EDUs in the document. By
+convention, position 0 is the fake root (or left padding); pairs from
+it are always kept.
+
+Documents are expected to provide the groupings the policies refer to,
+as sequences (or dictionaries) from EDU position to group number, eg.
+`edu2sent` or `edu2para` for RST-DT documents.
+"""
+
+from __future__ import print_function
+from collections import Counter
+
+
+class MaxDistance(object):
+    """
+    Keep the pairs of EDUs that are at most `limit` positions apart
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.name = 'distance<={}'.format(limit)
+
+    def keep(self, doc, num1, num2):
+        "if the pair of EDUs at these positions in `doc` is kept"
+        return num1 == 0 or abs(num1 - num2) <= self.limit
+
+
+class SameOrAdjacent(object):
+    """
+    Keep the pairs of EDUs that are in the same or adjacent groups
+    (eg. sentences), as given by the `attr` attribute of the document.
+
+    EDUs that are not known to be in any group (None) are given the
+    benefit of the doubt
+    """
+    def __init__(self, attr, name=None):
+        self.attr = attr
+        self.name = name or 'adjacent-{}'.format(attr)
+
+    def keep(self, doc, num1, num2):
+        "if the pair of EDUs at these positions in `doc` is kept"
+        if num1 == 0:
+            return True
+        groups = getattr(doc, self.attr)
+        grp1 = groups[num1]
+        grp2 = groups[num2]
+        return grp1 is None or grp2 is None or abs(grp1 - grp2) <= 1
+
+
+def keeps(policies, doc, num1, num2):
+    """
+    True if all of the policies keep the pair of EDUs at these
+    positions (in particular, if there are no policies)
+    """
+    return all(p.keep(doc, num1, num2) for p in policies)
+
+
+def coverage(policies, docs, gold_attachments):
+    """
+    Gold-attachment coverage of the policies: how many of the gold
+    attachments each one of them (and all of them together, if there
+    are several) would drop
+
+    Parameters
+    ----------
+    policies: [policy]
+
+    docs: iterable of documents
+
+    gold_attachments: function from document to [(int, int)]
+        positions of the EDUs in each gold attachment of a document
+
+    Returns
+    -------
+    report: [(string, int, int)]
+        name of each policy, total number of gold attachments, number
+        of attachments dropped
+    """
+    combos = [(p.name, [p]) for p in policies]
+    if len(policies) > 1:
+        combos.append(('all', policies))
+    total = 0
+    dropped = Counter()
+    for doc in docs:
+        for num1, num2 in gold_attachments(doc):
+            total += 1
+            for name, combo in combos:
+                if not keeps(combo, doc, num1, num2):
+                    dropped[name] += 1
+    return [(name, total, dropped[name]) for name, _ in combos]
+
+
+def dump_coverage(report, out):
+    """
+    Print a coverage report (see `coverage`) to a file handle
+    """
+    print('policy\tgold\tdropped\tcoverage', file=out)
+    for name, total, dropped in report:
+        ratio = float(total - dropped) / total if total else 1.0
+        print('{}\t{}\t{}\t{:.2%}'.format(name, total, dropped, ratio),
+              file=out)
+
+
+# ---------------------------------------------------------------------
+# command line
+# ---------------------------------------------------------------------
+
+def add_pair_policy_args(parser, groupings):
+    """
+    Augment a subcommand argparser with flags to select pruning policies
+
+    :param groupings: document attribute for each grouping that
+                      can be used for `SameOrAdjacent` pruning
+    :type groupings: dict(string, string)
+    """
+    parser.add_argument('--max-edu-distance', metavar='N', type=int,
+                        help='Only keep pairs of EDUs at most N apart')
+    parser.add_argument('--same-or-adjacent',
+                        choices=sorted(groupings),
+                        action='append', default=[],
+                        help='Only keep pairs of EDUs in the same or '
+                        'adjacent groupings (may be repeated)')
+    parser.add_argument('--pair-coverage', action='store_true',
+                        help='Report how many gold attachments the '
+                        'pruning policies drop')
+
+
+def mk_pair_policies(args, groupings):
+    """
+    Pruning policies selected by the flags from `add_pair_policy_args`
+    """
+    policies = []
+    if args.max_edu_distance is not None:
+        policies.append(MaxDistance(args.max_edu_distance))
+    for name in args.same_or_adjacent:
+        policies.append(SameOrAdjacent(groupings[name],
+                                       name='adjacent-' + name))
+    return policies
@@ -7,7 +7,6 @@ PDTB Corpus management (re-exported by educe.pdtb)
 
 from glob import glob
 import os
-import sys
 
 from educe.corpus import FileId
 import educe.corpus
@@ -34,24 +33,14 @@ class Reader(educe.corpus.Reader):
             anno_files[k] = fname
         return anno_files
 
-    def slurp_subcorpus(self, cfiles, verbose=False):
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
         """
         See `educe.rst_dt.parse` for a description of `RSTTree`
         """
-        corpus = {}
-        counter = 0
-        for k in cfiles.keys():
-            if verbose:
-                sys.stderr.write("\rSlurping corpus dir [%d/%d]" %
-                                 (counter, len(cfiles)))
-            fname = cfiles[k]
-            annotations = parse.parse(fname)
-            #annotations.set_origin(k)
-            corpus[k] = annotations
-            counter = counter+1
-        if verbose:
-            sys.stderr.write("\rSlurping corpus dir [%d/%d done]\n" %
-                             (counter, len(cfiles)))
+        corpus = self._slurp_files(parse.parse, cfiles,
+                                   verbose=verbose, workers=workers,
+                                   cache_dir=cache_dir)
         return corpus
 
 
@@ -21,7 +21,9 @@ def read_corpus(args, verbose=True):
     is_interesting = educe.util.mk_is_interesting(args)
     reader = educe.pdtb.Reader(args.corpus)
     anno_files = reader.filter(reader.files(), is_interesting)
-    return reader.slurp(anno_files, verbose)
+    return reader.slurp(anno_files, verbose,
+                        workers=getattr(args, 'workers', None),
+                        cache_dir=getattr(args, 'cache_dir', None))
 
 
 def get_output_dir(args):
@@ -61,6 +63,7 @@ def add_usual_input_args(parser):
     arguments, in which case, just don't call this function.
     """
     parser.add_argument('corpus', metavar='DIR', help='corpus dir')
+    educe.util.add_cache_args(parser)
     educe.util.add_corpus_filters(parser, fields=['doc'])
 
 
@@ -6,7 +6,6 @@ Corpus management (re-exported by educe.rst_dt)
 """
 
 import os
-import sys
 from glob import glob
 from os.path import dirname
 from os.path import join
@@ -60,23 +59,16 @@ class Reader(educe.corpus.Reader):
             anno_files[k] = (fname, text_file)
         return anno_files
 
-    def slurp_subcorpus(self, cfiles, verbose=False):
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
         """
         See `educe.rst_dt.parse` for a description of `RSTTree`
         """
-        corpus = {}
-        counter = 0
-        for k in cfiles.keys():
-            if verbose:
-                sys.stderr.write("\rSlurping corpus dir [%d/%d]" %
-                                 (counter, len(cfiles)))
-            annotations = parse.read_annotation_file(*cfiles[k])
+        corpus = self._slurp_files(parse.read_annotation_file, cfiles,
+                                   verbose=verbose, workers=workers,
+                                   cache_dir=cache_dir)
+        for k, annotations in corpus.items():
             annotations.set_origin(k)
-            corpus[k] = annotations
-            counter = counter+1
-        if verbose:
-            sys.stderr.write("\rSlurping corpus dir [%d/%d done]\n" %
-                             (counter, len(cfiles)))
         return corpus
 
 
@@ -150,7 +142,10 @@ class RstDtParser(object):
         anno_files_unfltd = self.reader.files(exclude_file_docs)
         is_interesting = educe.util.mk_is_interesting(args)
         anno_files = self.reader.filter(anno_files_unfltd, is_interesting)
-        self.corpus = self.reader.slurp(anno_files, verbose=True)
+        self.corpus = self.reader.slurp(
+            anno_files, verbose=True,
+            workers=getattr(args, 'workers', None),
+            cache_dir=getattr(args, 'cache_dir', None))
         # WIP rewrite pseudo-relations
         self.fix_pseudo_rels = fix_pseudo_rels
         # setup label converter for the desired granularity
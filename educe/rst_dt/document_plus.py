@@ -10,6 +10,7 @@ import itertools
 import numpy as np
 
 from educe.external.postag import Token
+from educe.learning.pair_policies import keeps
 from educe.util import relative_indices
 from .text import Sentence, Paragraph, clean_edu_text
 from .annotation import EDU
@@ -399,12 +400,27 @@ class DocumentPlus(object):
 
         return self
 
-    def all_edu_pairs(self):
-        """Generate all EDU pairs of a document"""
+    def all_edu_pairs(self, policies=None):
+        """Generate all EDU pairs of a document, or if pruning policies
+        are given (see `educe.learning.pair_policies`), those that all
+        of them keep.
+
+        NB: this is a generator
+        """
         edus = self.edus
-        all_pairs = [epair for epair in itertools.product(edus, edus[1:])
-                     if epair[0] != epair[1]]
-        return all_pairs
+        for edu1, edu2 in itertools.product(edus, edus[1:]):
+            if edu1 != edu2 and keeps(policies or [], self,
+                                      edu1.num, edu2.num):
+                yield (edu1, edu2)
+
+    def gold_attachments(self):
+        """Return the positions (in `self.edus`) of the EDUs in each of
+        the dependencies of this document (none if it has no tree)
+        """
+        if not self.deptree:
+            return []
+        return [(src.num, tgt.num)
+                for src, tgt, _ in self.deptree.get_dependencies()]
 
     def relations(self, edu_pairs):
         """Get the relation that holds in each of the edu_pairs"""
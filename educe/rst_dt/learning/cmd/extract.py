@@ -11,6 +11,7 @@ Extract features to CSV files
 from __future__ import print_function
 import os
 import itertools
+import sys
 
 import educe.corpus
 import educe.glozz
@@ -21,6 +22,10 @@ from educe.learning.edu_input_format import (dump_all,
                                              load_labels)
 from educe.learning.vocabulary_format import (dump_vocabulary,
                                               load_vocabulary)
+from educe.learning.pair_policies import (add_pair_policy_args,
+                                          coverage,
+                                          dump_coverage,
+                                          mk_pair_policies)
 from ..args import add_usual_input_args
 from ..doc_vectorizer import DocumentCountVectorizer, DocumentLabelExtractor
 from educe.rst_dt.corpus import RstDtParser
@@ -30,6 +35,10 @@ from educe.rst_dt.corenlp import CoreNlpParser
 
 NAME = 'extract'
 
+PAIR_GROUPINGS = {'sentence': 'edu2sent',
+                  'paragraph': 'edu2para'}
+"groupings of EDUs that candidate pairs can be restricted to"
+
 
 # ----------------------------------------------------------------------
 # options
@@ -42,6 +51,7 @@ def config_argparser(parser):
     add_usual_input_args(parser)
     parser.add_argument('corpus', metavar='DIR',
                         help='Corpus dir (eg. data/pilot)')
+    educe.util.add_cache_args(parser)
     # TODO make optional and possibly exclusive from corenlp below
     parser.add_argument('ptb', metavar='DIR',
                         help='PTB directory (eg. PTBIII/parsed/wsj)')
@@ -94,6 +104,7 @@ def config_argparser(parser):
     parser.add_argument('--experimental', action='store_true',
                         help='Enable experimental features '
                              '(currently none)')
+    add_pair_policy_args(parser, PAIR_GROUPINGS)
     parser.set_defaults(func=main)
 
 
@@ -192,7 +203,12 @@ def main(args):
     # to iterate over a stable (sorted) list of FileIds
     docs = [open_plus(doc) for doc in sorted(rst_corpus)]
     # instance generator
-    instance_generator = lambda doc: doc.all_edu_pairs()
+    policies = mk_pair_policies(args, PAIR_GROUPINGS)
+    instance_generator = lambda doc: doc.all_edu_pairs(policies)
+    if args.pair_coverage and not live:
+        dump_coverage(coverage(policies, docs,
+                               lambda doc: doc.gold_attachments()),
+                      sys.stderr)
     split_feat_space = 'dir_sent'
     # extract vectorized samples
     if args.vocabulary is not None:
@@ -371,10 +371,7 @@ def twin_from(doc, anno):
     Given a document and an annotation, return the first annotation in
     the document with a matching local identifier.
     """
-    anno_local_id = anno.local_id()
-    twins = [u for u in doc.annotations()
-             if u.local_id() == anno_local_id]
-    return twins[0] if twins else None
+    return doc.get_annotation(anno.local_id())
 
 
 def speaker(anno):
@@ -7,7 +7,7 @@ import copy
 import itertools as itr
 import warnings
 
-from educe.annotation import Span
+from educe.annotation import Span, SpanIndex
 from .annotation import (is_edu, is_cdu, is_dialogue, is_turn,
                          split_turn_text,
                          TURN_TYPES)
@@ -179,7 +179,8 @@ class Context(object):
                 raise Exception(oops)
 
     @classmethod
-    def _for_edu(cls, enclosure, doc_turns, doc_tstars, edu):
+    def _for_edu(cls, enclosure, doc_turns, doc_tstars, edu,
+                 turn_edus=None, dialogue_turns=None):
         """Extract the context for a single EDU, but with the benefit of an
         enclosure graph to avoid repeatedly combing over objects
 
@@ -188,35 +189,51 @@ class Context(object):
         enclosure: EnclosureGraph
 
         doc_turns: [Unit]
-            All turn-level annotations within a document. This is somewhat
-            redundant with the enclosure graph, but perhaps more convenient
+            All turn-level annotations within a document, sorted by
+            first-widest span. This is somewhat redundant with the
+            enclosure graph, but perhaps more convenient
 
-        doc_tstars: [Unit]
+        doc_tstars: [Unit] or SpanIndex
             All turn star annotations within a document. Turn stars are not
             native to the document and have to be computed separately.
             For example, the will not be part of the enclosure graph
             unless you apply a merge_turn_stars on it.
 
         edu: Unit
+
+        turn_edus: dict(Unit, [Unit]), optional
+            Sorted EDUs of each turn seen so far (filled in as we go,
+            so that the EDUs of a turn share the same list)
+
+        dialogue_turns: dict(Unit, [Unit]), optional
+            Sorted turns of each dialogue seen so far (likewise)
         """
+        if turn_edus is None:
+            turn_edus = {}
+        if dialogue_turns is None:
+            dialogue_turns = {}
         turn = cls._the(edu, enclosure.outside(edu),
                         TURN_TYPES)
         tstar = cls._the(edu, containing(edu.text_span(), doc_tstars),
                          TURN_TYPES)
-        t_edus = [x for x in enclosure.inside(turn) if is_edu(x)]
-        assert t_edus
+        if turn not in turn_edus:
+            t_edus = [x for x in enclosure.inside(turn) if is_edu(x)]
+            assert t_edus
+            turn_edus[turn] = sorted_first_widest(t_edus)
         dialogue = cls._the(edu, enclosure.outside(turn),
                             ['Dialogue'])
-        d_turns = [x for x in enclosure.inside(dialogue) if is_turn(x)]
-        assert d_turns
+        if dialogue not in dialogue_turns:
+            d_turns = [x for x in enclosure.inside(dialogue) if is_turn(x)]
+            assert d_turns
+            dialogue_turns[dialogue] = sorted_first_widest(d_turns)
         tokens = [wrapped.token for wrapped in enclosure.inside(edu)
                   if isinstance(wrapped, WrappedToken)]
         return cls(turn=turn,
                    tstar=tstar,
-                   turn_edus=sorted_first_widest(t_edus),
+                   turn_edus=turn_edus[turn],
                    dialogue=dialogue,
-                   dialogue_turns=sorted_first_widest(d_turns),
-                   doc_turns=sorted_first_widest(doc_turns),
+                   dialogue_turns=dialogue_turns[dialogue],
+                   doc_turns=doc_turns,
                    tokens=tokens)
 
     @classmethod
@@ -224,6 +241,10 @@ class Context(object):
         """
         Return a dictionary of context objects for each EDU in the document
 
+        The document-wide tables (sorted turns, the turns of each
+        dialogue, the EDUs of each turn) are computed once and shared
+        between the contexts, so treat their lists as read-only
+
         Returns
         -------
         contexts: dict(educe.glozz.Unit, Context)
@@ -234,7 +255,7 @@ class Context(object):
             egraph = EnclosureGraph(doc, postags)
         else:
             egraph = EnclosureGraph(doc)
-        doc_turns = [x for x in doc.units if is_turn(x)]
+        doc_turns = sorted_first_widest(x for x in doc.units if is_turn(x))
         # pylint: disable=bare-except
         # TODO: it would be nice if merge_turn_stars could return a
         # smaller exception for its difficulties
@@ -247,12 +268,16 @@ class Context(object):
             warnings.warn(oops)
             tstar_doc = doc
         # pylint: enable=bare-except
-        tstars = [x for x in tstar_doc.units if is_turn(x)]
+        tstars = SpanIndex(x for x in tstar_doc.units if is_turn(x))
+        turn_edus = {}
+        dialogue_turns = {}
         contexts = {}
         for edu in doc.units:
             if not is_edu(edu):
                 continue
-            contexts[edu] = cls._for_edu(egraph, doc_turns, tstars, edu)
+            contexts[edu] = cls._for_edu(egraph, doc_turns, tstars, edu,
+                                         turn_edus=turn_edus,
+                                         dialogue_turns=dialogue_turns)
         return contexts
 
 
@@ -276,7 +301,12 @@ def enclosed(span, annos):
     """
     Given an iterable of standoff, pick just those that are
     enclosed by the given span (ie. are smaller and within)
+
+    If `annos` is a `SpanIndex` (see `Document.span_index`),
+    we query it instead of scanning
     """
+    if isinstance(annos, SpanIndex):
+        return annos.enclosed(span)
     return [anno for anno in annos if span.encloses(anno.span)]
 
 
@@ -284,7 +314,12 @@ def containing(span, annos):
     """
     Given an iterable of standoff, pick just those that
     enclose/contain the given span (ie. are bigger and around)
+
+    If `annos` is a `SpanIndex` (see `Document.span_index`),
+    we query it instead of scanning
     """
+    if isinstance(annos, SpanIndex):
+        return annos.containing(span)
     return [anno for anno in annos if anno.span.encloses(span)]
 
 
@@ -293,7 +328,7 @@ def edus_in_span(doc, span):
     Given an document and a text span return the EDUs the
     document contains in that span
     """
-    return [anno for anno in enclosed(span, doc.units)
+    return [anno for anno in doc.span_index().enclosed(span)
             if is_edu(anno)]
 
 
@@ -302,5 +337,5 @@ def turns_in_span(doc, span):
     Given a document and a text span, return the turns that the
     document contains in that span
     """
-    return [anno for anno in enclosed(span, doc.units)
+    return [anno for anno in doc.span_index().enclosed(span, TURN_TYPES)
             if is_turn(anno)]
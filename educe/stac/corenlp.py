@@ -24,6 +24,7 @@ import os.path
 import nltk.tree
 
 from educe import stac, corpus
+from educe.corpus import Corpus
 from educe.external.corenlp import (CoreNlpToken, CoreNlpDocument,
                                     CoreNlpWrapper)
 from educe.external.coref import (Chain, Mention)
@@ -65,12 +66,13 @@ def run_pipeline(corpus, outdir, corenlp_dir, split=False):
         # for each document, how many digits do we need to represent the
         # turns in that document; for essentially cosmetic purposes
         # (padding)
+        if not isinstance(corpus, Corpus):
+            corpus = Corpus(corpus)
         digits = {}
-        for d in frozenset([k.doc for k in corpus]):
+        for d in corpus.values_of('doc'):
             turns = []
-            for k in corpus:
-                if k.doc == d:
-                    turns.extend(list(filter(stac.is_turn, corpus[k].units)))
+            for k in corpus.select(doc=d):
+                turns.extend(list(filter(stac.is_turn, corpus[k].units)))
             turn_ids = [int(t.features['Identifier']) for t in turns]
             digits[d] = max(2, int(math.ceil(math.log10(max(turn_ids)))))
 
@@ -6,12 +6,13 @@ Corpus layout conventions (re-exported by educe.stac)
 """
 
 from collections import OrderedDict
+from fnmatch import fnmatch
 from glob import glob
 import copy
 import os
 import re
-import sys
 
+from educe.cache import ListingCache
 from educe.corpus import FileId
 import educe.corpus
 import educe.glozz as glozz
@@ -27,10 +28,38 @@ class Reader(educe.corpus.Reader):
     def __init__(self, corpusdir):
         educe.corpus.Reader.__init__(self, corpusdir)
 
-    def files(self):
+    def files(self, filters=None, cache_dir=None):
+        """
+        Return a dictionary from FileId to pairs of annotation and
+        text file paths (see `educe.corpus.Reader.files`)
+
+        :param filters: dictionary from FileId fields to predicates on
+                        their values (see `educe.util.mk_field_filters`);
+                        the directories of documents, stages or
+                        annotators that do not match are not even listed
+        :type  filters: dict(string, string -> bool)
+
+        :param cache_dir: if set, remember directory listings in this
+                          directory, and reuse them as long as the
+                          directories they list have not changed
+                          (see `educe.cache.ListingCache`)
+        :type  cache_dir: string
+        """
         corpus = OrderedDict()
-        full_glob = os.path.join(self.rootdir, '*')
-        anno_glob = '*.aa'
+        filters = filters or {}
+        listings = ListingCache(cache_dir, self.rootdir)
+
+        def wanted(field, value):
+            "if the given field value passes our filters"
+            pred = filters.get(field)
+            return pred is None or (value is not None and bool(pred(value)))
+
+        def anno_files(path):
+            "annotation files in the given directory"
+            return [os.path.join(path, name)
+                    for name, is_dir in listings.listdir(path)
+                    if not is_dir and not name.startswith('.') and
+                    fnmatch(name, '*.aa')]
 
         def register(stage, annotator, anno_file):
             """
@@ -42,6 +71,8 @@ class Reader(educe.corpus.Reader):
             subdoc = os.path.basename(prefix)
             if "_" in subdoc:
                 subdoc = subdoc.rsplit("_", 1)[1]
+                if not wanted('subdoc', subdoc):
+                    return
                 file_id = FileId(doc, subdoc, stage, annotator)
                 ac_file_id = FileId(doc, subdoc, 'unannotated', None)
                 text_file = os.path.join(self.rootdir,
@@ -52,40 +83,58 @@ class Reader(educe.corpus.Reader):
                                 "the form doc_subdocument: %s", subdoc)
             corpus[file_id] = (anno_file, text_file)
 
-        for doc_dir in sorted(glob(full_glob)):
-            doc = os.path.basename(doc_dir)
+        for doc, is_dir in listings.listdir(self.rootdir):
+            if not is_dir or doc.startswith('.') or not wanted('doc', doc):
+                continue
+            doc_dir = os.path.join(self.rootdir, doc)
             for stage in ['unannotated', 'units', 'discourse']:
+                if not wanted('stage', stage):
+                    continue
                 stage_dir = os.path.join(doc_dir, stage)
                 if stage == 'unannotated':
-                    unannotated_files = glob(os.path.join(stage_dir,
-                                                          anno_glob))
-                    for anno_file in unannotated_files:
+                    if not wanted('annotator', None):
+                        continue
+                    for anno_file in anno_files(stage_dir):
                         register(stage, None, anno_file)
-                elif os.path.exists(stage_dir):
-                    for annotator in os.listdir(stage_dir):
+                else:
+                    for annotator, is_dir in listings.listdir(stage_dir):
+                        if not is_dir or not wanted('annotator', annotator):
+                            continue
                         anno_dir = os.path.join(stage_dir, annotator)
-                        anno_files = glob(os.path.join(anno_dir, anno_glob))
-                        for anno_file in anno_files:
+                        for anno_file in anno_files(anno_dir):
                             register(stage, annotator, anno_file)
+        listings.save()
         return corpus
 
-    def slurp_subcorpus(self, cfiles, verbose=False):
-        corpus = {}
-        counter = 0
-        for k in cfiles.keys():
-            if verbose:
-                sys.stderr.write("\rSlurping corpus dir [%d/%d]" %
-                                 (counter, len(cfiles)))
-            annotations = glozz.read_annotation_file(*cfiles[k])
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
+        # All the stages and annotators of a subdocument share the same
+        # .ac file, so rather than having each parse read and decode it
+        # again, we read the annotations alone and then hand each text
+        # out once to all the documents that need it
+        corpus = self._slurp_files(_read_annotations_only, cfiles,
+                                   verbose=verbose, workers=workers,
+                                   cache_dir=cache_dir)
+        texts = {}
+        for k, annotations in corpus.items():
+            text_file = cfiles[k][1]
+            if text_file is not None:
+                text_path = os.path.abspath(text_file)
+                if text_path not in texts:
+                    texts[text_path] = glozz.read_text_file(text_file)
+                annotations.set_text(texts[text_path])
             annotations.set_origin(k)
-            corpus[k] = annotations
-            counter = counter+1
-        if verbose:
-            sys.stderr.write("\rSlurping corpus dir [%d/%d done]\n" %
-                             (counter, len(cfiles)))
         return corpus
 
 
+def _read_annotations_only(anno_filename, _text_filename=None):
+    """
+    Read a glozz annotation file, leaving its text out (see
+    `Reader.slurp_subcorpus`)
+    """
+    return glozz.read_annotation_file(anno_filename)
+
+
 class LiveInputReader(Reader):
     """
     Reader for unannotated 'live' data that we want to parse.
@@ -100,7 +149,14 @@ class LiveInputReader(Reader):
     def __init__(self, corpusdir):
         Reader.__init__(self, corpusdir)
 
-    def files(self):
+    # pylint: disable=unused-argument
+    def files(self, filters=None, cache_dir=None):
+        """
+        Return a dictionary from FileId to pairs of annotation and
+        text file paths. The `filters` and `cache_dir` of
+        `Reader.files` are accepted but ignored: there is only the
+        one directory to list
+        """
         corpus = {}
         for anno_file in glob(os.path.join(self.rootdir, '*.aa')):
             prefix = os.path.splitext(anno_file)[0]
@@ -111,6 +167,7 @@ class LiveInputReader(Reader):
                                     annotator=None)
             corpus[k] = pair
         return corpus
+    # pylint: enable=unused-argument
 
 
 def id_to_path(k):
@@ -122,7 +179,7 @@ def id_to_path(k):
     this path
     """
     for field in ["doc", "stage"]:
-        if k.__dict__[field] is None:
+        if getattr(k, field) is None:
             raise Exception("Need all FileId fields to be set"
                             " (%s is unset)" % field)
     root = k.doc
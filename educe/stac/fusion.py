@@ -30,9 +30,9 @@ feature-extraction
 
 from __future__ import print_function
 import copy
-import itertools as itr
 
 from educe.annotation import (Span, Unit)
+from educe.learning.pair_policies import keeps
 from educe.stac.annotation import (is_edu, speaker, turn_id, twin_from)
 from educe.stac.context import (Context)
 
@@ -51,28 +51,42 @@ class Dialogue(object):
         # we start from 1 because 0 is for the fake root
         self.edu2sent = {i: e.subgrouping()
                          for i, e in enumerate(edus, start=1)}
+        # position of the turn of each EDU within the dialogue
+        turn_pos = {}
+        for e in edus:
+            if e.turn not in turn_pos and e.dialogue_turns:
+                turn_pos.update((t, i) for i, t in
+                                enumerate(e.dialogue_turns))
+        self.edu2turn = {i: turn_pos.get(e.turn)
+                         for i, e in enumerate(edus, start=1)}
         self.relations = relations
 
-    def edu_pairs(self):
-        """Return all EDU pairs within this dialogue.
+    def edu_pairs(self, policies=None):
+        """Return all EDU pairs within this dialogue, or if pruning
+        policies are given (see `educe.learning.pair_policies`), those
+        that all of them keep.
 
         NB: this is a generator
         """
-        i_edus = list(enumerate(self.edus))
-        _, fakeroot = i_edus[0]
-        i_edus = i_edus[1:]  # drop left padding EDU
-        for _, edu in i_edus:
-            yield (fakeroot, edu)
-        for num1, edu1 in i_edus:
-            def is_before(numedu2):
-                'true if we have seen the EDU already'
-                # pylint: disable=cell-var-from-loop
-                num2 = numedu2[0]
-                return num2 <= num1
-                # pylint: enable=cell-var-from-loop
-            for _, edu2 in itr.dropwhile(is_before, i_edus):
-                yield (edu1, edu2)
-                yield (edu2, edu1)
+        policies = policies or []
+        edus = self.edus
+        fakeroot = edus[0]  # left padding EDU
+        for num, edu in enumerate(edus[1:], start=1):
+            if keeps(policies, self, 0, num):
+                yield (fakeroot, edu)
+        for num1 in range(1, len(edus)):
+            for num2 in range(num1 + 1, len(edus)):
+                if keeps(policies, self, num1, num2):
+                    yield (edus[num1], edus[num2])
+                if keeps(policies, self, num2, num1):
+                    yield (edus[num2], edus[num1])
+
+    def gold_attachments(self):
+        """Return the positions (in `self.edus`) of the EDUs in each
+        of the relations within this dialogue
+        """
+        pos = {e: i for i, e in enumerate(self.edus)}
+        return [(pos[e1], pos[e2]) for e1, e2 in self.relations]
 
 
 # pylint: disable=too-many-instance-attributes
@@ -239,35 +253,48 @@ def fuse_edus(discourse_doc, unit_doc, postags):
       (it's unlikely but best be on the safe side if you ever find yourself
       with automatically generated annotations, where all bets are off
       time-stamp wise).
+    * The returned document shares its text, and the spans, features
+      and metadata of its annotations with the discourse document.
+      Its units that are not EDUs are shared outright; relations and
+      schemas are (shallow) copies whose members point to the new EDUs.
     """
-    doc = copy.deepcopy(discourse_doc)
-
     # first pass: create the EDU objects
-    annos = sorted([x for x in doc.units if is_edu(x)],
+    annos = sorted([x for x in discourse_doc.units if is_edu(x)],
                    key=lambda x: x.span)
+    doc = copy.copy(discourse_doc)
     replacements = {}
     for anno in annos:
         unit_anno = None if unit_doc is None else twin_from(unit_doc, anno)
-        edu = EDU(doc, anno, unit_anno)
-        replacements[anno] = edu
+        replacements[anno] = EDU(doc, anno, unit_anno)
+    for anno in discourse_doc.relations + discourse_doc.schemas:
+        twin = copy.copy(anno)
+        twin._text_span_cache = None  # pylint: disable=protected-access
+        replacements[anno] = twin
 
     # second pass: rewrite doc so that annotations that corresponds
     # to EDUs are replacement by their higher-level equivalents
-    edus = []
-    for anno in annos:
-        edu = replacements[anno]
-        edus.append(edu)
-        doc.units.remove(anno)
-        doc.units.append(edu)
-        for rel in doc.relations:
-            if rel.source == anno:
-                rel.source = edu
-            if rel.target == anno:
-                rel.target = edu
-        for schema in doc.schemas:
-            if anno in schema.units:
-                schema.units.remove(anno)
-                schema.units.append(edu)
+    # (EDUs go after the other units, in textual order)
+    # pylint: disable=protected-access
+    # the fields are set directly as the copies are brand new: there
+    # are no text spans computed from them that we'd need to invalidate
+    def replace(anno):
+        "the counterpart of an annotation in the new document"
+        return replacements.get(anno, anno)
+
+    edus = [replacements[x] for x in annos]
+    for rel in discourse_doc.relations:
+        twin = replacements[rel]
+        twin._source = replace(rel.source)
+        twin._target = replace(rel.target)
+    for schema in discourse_doc.schemas:
+        twin = replacements[schema]
+        if schema.members is not None:
+            twin._members_ = [replace(x) for x in schema.members]
+    # pylint: enable=protected-access
+    doc.units = [x for x in discourse_doc.units if x not in replacements] +\
+        edus
+    doc.relations = [replacements[x] for x in discourse_doc.relations]
+    doc.schemas = [replacements[x] for x in discourse_doc.schemas]
 
     # fourth pass: flesh out the EDUs with contextual info
     # now the EDUs should be work as contexts too
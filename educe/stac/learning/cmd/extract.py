@@ -25,6 +25,10 @@ from educe.learning.edu_input_format import (dump_all,
                                              dump_edu_input_file)
 from educe.learning.vocabulary_format import (dump_vocabulary,
                                               load_vocabulary)
+from educe.learning.pair_policies import (add_pair_policy_args,
+                                          coverage,
+                                          dump_coverage,
+                                          mk_pair_policies)
 import educe.glozz
 import educe.stac
 import educe.util
@@ -38,6 +42,9 @@ from ..features import (strip_cdus,
 
 NAME = 'extract'
 
+PAIR_GROUPINGS = {'turn': 'edu2turn'}
+"groupings of EDUs that candidate pairs can be restricted to"
+
 
 # ----------------------------------------------------------------------
 # options
@@ -75,6 +82,10 @@ def config_argparser(parser):
                         choices=['head', 'broadcast', 'custom'],
                         default='head',
                         help='CDUs stripping method (if going into CDUs)')
+    # --cache-dir: also keeps single EDU features between runs
+    # --workers: also extracts features for N documents at a time
+    educe.util.add_cache_args(parser)
+    add_pair_policy_args(parser, PAIR_GROUPINGS)
     parser.set_defaults(func=main)
 
 # ---------------------------------------------------------------------
@@ -94,11 +105,13 @@ def main_single(args):
 
     # pylint: disable=invalid-name
     # scikit-convention
-    feats = extract_single_features(inputs, stage)
+    feats = extract_single_features(inputs, stage, jobs=args.workers or 1)
     vzer = KeyGroupVectorizer()
     # TODO? just transform() if args.parsing or args.vocabulary?
     X_gen = vzer.fit_transform(feats)
     # pylint: enable=invalid-name
+    if inputs.feature_store is not None:
+        inputs.feature_store.evict()
     labtor = DialogueActVectorizer(instance_generator, DIALOGUE_ACTS)
     y_gen = labtor.transform(dialogues)
 
@@ -126,14 +139,21 @@ def main_pairs(args):
     # these paths should go away once we switch to a proper dumper
     out_file = fp.join(args.output,
                        fp.basename(args.corpus) + '.relations.sparse')
-    instance_generator = lambda x: x.edu_pairs()
+    policies = mk_pair_policies(args, PAIR_GROUPINGS)
+    instance_generator = lambda x: x.edu_pairs(policies)
+
+    if args.pair_coverage and not args.parsing:
+        dump_coverage(coverage(policies, dialogues,
+                               lambda x: x.gold_attachments()),
+                      sys.stderr)
 
     labels = frozenset(SUBORDINATING_RELATIONS +
                        COORDINATING_RELATIONS)
 
     # pylint: disable=invalid-name
     # scikit-convention
-    feats = extract_pair_features(inputs, stage)
+    feats = extract_pair_features(inputs, stage, policies,
+                                  jobs=args.workers or 1)
     vzer = KeyGroupVectorizer()
     if args.parsing or args.vocabulary:
         vzer.vocabulary_ = load_vocabulary(args.vocabulary)
@@ -141,6 +161,8 @@ def main_pairs(args):
     else:
         X_gen = vzer.fit_transform(feats)
     # pylint: enable=invalid-name
+    if inputs.feature_store is not None:
+        inputs.feature_store.evict()
     labtor = LabelVectorizer(instance_generator, labels,
                              zero=args.parsing)
     y_gen = labtor.transform(dialogues)
@@ -7,29 +7,31 @@ to this library
 """
 
 from __future__ import absolute_import, print_function
+from bisect import bisect_left, bisect_right
 from collections import defaultdict, namedtuple
-from functools import wraps
+from functools import partial, wraps
 from itertools import chain
-import collections
 import copy
-import itertools as itr
+import hashlib
+import multiprocessing
 import os
 import re
 import sys
 
 from nltk.corpus import verbnet as vnet
+from six.moves.collections_abc import Sequence
 from soundex import Soundex
 
 from educe.annotation import (Span)
+from educe.cache import (FeatureStore, dir_signature)
+from educe.corpus import Corpus
 from educe.external.parser import\
     SearchableTree,\
     ConstituencyTree
 from educe.learning.keys import (MagicKey, Key, KeyGroup, MergedKeyGroup)
 from educe.stac import postag, corenlp
 from educe.stac.annotation import speaker, addressees, is_relation_instance
-from educe.stac.context import (enclosed,
-                                edus_in_span,
-                                turns_in_span)
+from educe.stac.context import (enclosed)
 from educe.stac.corpus import (twin_key)
 from educe.learning.csv import tune_for_csv
 from educe.learning.util import tuple_feature, underscore
@@ -154,7 +156,7 @@ def emoticons(tokens):
 
 def is_just_emoticon(tokens):
     "Return true if a sequence of tokens consists of a single emoticon"
-    if not isinstance(tokens, collections.Sequence):
+    if not isinstance(tokens, Sequence):
         raise TypeError("tokens must form a sequence")
     return bool(emoticons(tokens)) and len(tokens) == 1
 
@@ -239,7 +241,7 @@ def has_pdtb_markers(markers, tokens):
     Given a sequence of tagged tokens, return True
     if any of the given PDTB markers appears within the tokens
     """
-    if not isinstance(tokens, collections.Sequence):
+    if not isinstance(tokens, Sequence):
         raise TypeError("tokens must form a sequence")
     words = [t.word for t in tokens]
     return pdtb_markers.Marker.any_appears_in(markers, words)
@@ -334,11 +336,14 @@ def enclosed_trees(span, trees):
 DocEnv = namedtuple("DocEnv", "inputs current sf_cache")
 
 # Global resources and settings used to extract feature vectors
+# (with an optional `FeatureStore` for single EDU features)
 FeatureInput = namedtuple('FeatureInput',
                           ['corpus', 'postags', 'parses',
                            'lexicons', 'pdtb_lex',
                            'verbnet_entries',
-                           'inquirer_lex'])
+                           'inquirer_lex',
+                           'feature_store'])
+FeatureInput.__new__.__defaults__ = (None,)
 
 # A document and relevant contextual information
 DocumentPlus = namedtuple('DocumentPlus',
@@ -629,18 +634,146 @@ def dialogue_act_pairs(current, _, edu):
     return clean_dialogue_act(real_dialogue_act(edu))
 
 
-EduGap = namedtuple("EduGap", "sf_cache inner_edus turns_between")
+def _turn_number(tid):
+    "main component of a turn id (see `turn_id`)"
+    # FIXME quick and dirty workaround for X.Y turn ids
+    return tid[0] if isinstance(tid, tuple) else tid
+
+
+def _is_tid_gap(tid_i, tid_j):
+    """
+    if some (non-linguistic) turns were skipped from one turn id to next
+    (we can't tell if either is missing, see `turn_follows_gap`)
+    """
+    if tid_i is None or tid_j is None:
+        return False
+    return _turn_number(tid_j) - _turn_number(tid_i) > 1
+
+
+class EduGapIndex(object):
+    """
+    Document-wide tables for the features on the gap between two EDUs:
+    the EDUs and turns of the document in textual order, with prefix
+    counts of questions and of skips in the turn numbering, and the
+    positions of the turns of each speaker.
+
+    The EDUs (or turns) enclosed by a span then make up a contiguous
+    range of these lists (we assume, as elsewhere, that EDUs do not
+    overlap each other, and likewise turns), so each gap feature can
+    be read off in constant or logarithmic time.
+
+    Parameters
+    ----------
+    doc: Document
+
+    sf_cache: FeatureCache
+        single EDU features (for questions); these are only looked
+        up if we need them
+    """
+    def __init__(self, doc, sf_cache):
+        self.sf_cache = sf_cache
+        self.edus = sorted([x for x in doc.units if educe.stac.is_edu(x)],
+                           key=lambda x: x.text_span())
+        self.turns = sorted([x for x in doc.units
+                             if educe.stac.is_turn(x)],
+                            key=lambda x: x.text_span())
+        self._edu_bounds = self._bounds(self.edus)
+        self._turn_bounds = self._bounds(self.turns)
+        self._questions = None
+
+        tids = [turn_id(x) for x in self.turns]
+        self._tid_gaps = [0]
+        for tid_i, tid_j in zip(tids[:-1], tids[1:]):
+            self._tid_gaps.append(self._tid_gaps[-1] +
+                                  int(_is_tid_gap(tid_i, tid_j)))
+
+        self._speaker_turns = defaultdict(list)
+        for i, turn in enumerate(self.turns):
+            self._speaker_turns[speaker(turn)].append(i)
+
+    @staticmethod
+    def _bounds(annos):
+        "start and end points of annotations (in textual order)"
+        spans = [x.text_span() for x in annos]
+        return ([x.char_start for x in spans],
+                [x.char_end for x in spans])
+
+    @staticmethod
+    def _enclosed(bounds, span):
+        "range of the positions of annotations enclosed by a span"
+        starts, ends = bounds
+        lo = bisect_left(starts, span.char_start)
+        hi = bisect_right(ends, span.char_end)
+        return lo, max(lo, hi)
+
+    def edus_enclosed(self, span):
+        """
+        Range (start, end) of positions in `self.edus` of the EDUs
+        enclosed in a span
+        """
+        return self._enclosed(self._edu_bounds, span)
+
+    def turns_enclosed(self, span):
+        """
+        Range (start, end) of positions in `self.turns` of the turns
+        enclosed in a span
+        """
+        return self._enclosed(self._turn_bounds, span)
+
+    def is_question(self, edu):
+        "if the EDU is a question (according to the single EDU features)"
+        return bool(self.sf_cache[edu]["is_question"])
+
+    def num_questions(self, edus):
+        "number of questions within the range of EDUs"
+        if self._questions is None:
+            self._questions = [0]
+            for edu in self.edus:
+                self._questions.append(self._questions[-1] +
+                                       int(self.is_question(edu)))
+        start, end = edus
+        return self._questions[end] - self._questions[start]
+
+    def num_speakers(self, turns):
+        "number of distinct speakers within the range of turns"
+        start, end = turns
+        count = 0
+        for positions in self._speaker_turns.values():
+            i = bisect_left(positions, start)
+            if i < len(positions) and positions[i] < end:
+                count += 1
+        return count
+
+    def num_tid_gaps(self, tid1, turns, tid2):
+        """
+        number of skips in the turn numbering going from a turn id,
+        through the range of turns, to another turn id
+        """
+        start, end = turns
+        if start == end:
+            return int(_is_tid_gap(tid1, tid2))
+        return (int(_is_tid_gap(tid1, turn_id(self.turns[start]))) +
+                self._tid_gaps[end - 1] - self._tid_gaps[start] +
+                int(_is_tid_gap(turn_id(self.turns[end - 1]), tid2)))
+
+
+# gap between two EDUs: the ranges of `EduGapIndex` EDUs and turns
+# between them (EDUs including the two themselves, if they are EDUs
+# of the document, ie. not the fake root, in which case they are the
+# `ends`)
+EduGap = namedtuple("EduGap", "index edus turns ends")
 
 
 #pylint: disable=unused-argument
 def num_edus_between(_current, gap, _edu1, _edu2):
     "number of intervening EDUs (0 if adjacent)"
-    return len(gap.inner_edus)
+    start, end = gap.edus
+    return end - start - len(gap.ends)
 
 
 def num_speakers_between(_current, gap, _edu1, _edu2):
     "number of distinct speakers in intervening EDUs"
-    return len(frozenset(speaker(t) for t in gap.turns_between))
+    return gap.index.num_speakers(gap.turns)
 
 
 def num_nonling_tstars_between(_current, gap, _edu1, _edu2):
@@ -656,23 +789,14 @@ def num_nonling_tstars_between(_current, gap, _edu1, _edu2):
         # end FIXME
 
     tid2 = turn_id(_edu2.turn)
-    tids_span = [tid1] + [turn_id(t) for t in gap.turns_between] + [tid2]
-    nb_nonling_tstars = 0
-    for tid_i, tid_j in zip(tids_span[:-1], tids_span[1:]):
-        # FIXME quick and dirty workaround for X.Y turn ids
-        tid_diff = ((tid_j[0] if isinstance(tid_j, tuple) else tid_j) -
-                    (tid_i[0] if isinstance(tid_i, tuple) else tid_i))
-        # end FIXME
-        if tid_diff > 1:
-            nb_nonling_tstars += 1
-
-    return nb_nonling_tstars
+    return gap.index.num_tid_gaps(tid1, gap.turns, tid2)
 
 
 def has_inner_question(current, gap, _edu1, _edu2):
     "if there is an intervening EDU that is a question"
-    return any(gap.sf_cache[x]["is_question"]
-               for x in gap.inner_edus)
+    index = gap.index
+    return (index.num_questions(gap.edus) -
+            sum(int(index.is_question(x)) for x in gap.ends)) > 0
 #pylint: enable=unused-argument
 
 
@@ -1061,23 +1185,18 @@ class PairSubgroup_Gap(PairSubgroup):
 
     def fill(self, current, edu1, edu2, target=None):
         vec = self if target is None else target
-        doc = current.doc
+        index = self.sf_cache.gap_index()
         big_span = edu1.text_span().merge(edu2.text_span())
 
         # spans for the turns that come between the two edus
         turns_between_span = Span(edu1.turn.text_span().char_end,
                                   edu2.turn.text_span().char_start)
-        turns_between = turns_in_span(doc, turns_between_span)
-
-        inner_edus = edus_in_span(doc, big_span)
-        if edu1.identifier() != ROOT:  # not present anyway
-            inner_edus.remove(edu1)
-        if edu2.identifier() != ROOT:
-            inner_edus.remove(edu2)
 
-        gap = EduGap(inner_edus=inner_edus,
-                     turns_between=turns_between,
-                     sf_cache=self.sf_cache)
+        gap = EduGap(index=index,
+                     edus=index.edus_enclosed(big_span),
+                     turns=index.turns_enclosed(turns_between_span),
+                     ends=[x for x in (edu1, edu2)
+                           if x.identifier() != ROOT])
 
         for key in self.keys:
             vec[key.name] = key.function(current, gap, edu1, edu2)
@@ -1122,17 +1241,93 @@ class PairKeys(MergedKeyGroup):
 # ---------------------------------------------------------------------
 
 
+SINGLE_FEATURES_VERSION = 1
+"""
+Version of the single EDU features in a `FeatureStore`: bump this
+whenever the way they are computed changes
+"""
+
+
+def _doc_hash(current):
+    """
+    Hash of the parts of a document (and its contextual information)
+    that single EDU features are computed from: EDUs and their tokens,
+    turns, dialogues, players and parses.
+
+    This leaves out relations, so that the EDUs of a discourse-level
+    document and of its units-level twin get the same features
+    """
+    doc = current.doc
+    parts = [doc.text()]
+    for anno in sorted(doc.units, key=lambda x: (x.span, x.local_id())):
+        span = anno.text_span()
+        if educe.stac.is_edu(anno):
+            tokens = getattr(anno, 'tokens', None) or []
+            parts.append(repr((anno.local_id(), anno.type,
+                               span.char_start, span.char_end,
+                               [(t.word, t.tag) for t in tokens])))
+        elif educe.stac.is_turn(anno) or educe.stac.is_dialogue(anno):
+            parts.append(repr((anno.local_id(), anno.type,
+                               span.char_start, span.char_end,
+                               sorted(anno.features.items()))))
+    parts.append(repr(sorted(current.players)))
+    if current.parses is not None:
+        parts.extend(str(tok) for tok in current.parses.tokens)
+        parts.extend(str(tree) for tree in current.parses.trees)
+        parts.extend(str(tree) for tree in current.parses.deptrees)
+    digest = hashlib.sha1('\n'.join(parts).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def mk_feature_store(args):
+    """
+    Store for single EDU features asked for by the `--cache-dir`
+    option (None if there is no such option).
+
+    The features also depend on the lexicons in the resource
+    directory, so any change there makes for a different version
+    """
+    cache_dir = getattr(args, 'cache_dir', None)
+    if cache_dir is None:
+        return None
+    version = '{}:{}'.format(SINGLE_FEATURES_VERSION,
+                             dir_signature(args.resources))
+    return FeatureStore(os.path.join(cache_dir, 'features'),
+                        version=version)
+
+
 class FeatureCache(dict):
     """
     Cache for single edu features.
     Retrieving an item from the cache lazily computes/memoises
     the single EDU features for it.
+
+    If the inputs come with a `FeatureStore`, features are looked
+    up there before being computed; see `save` for putting newly
+    computed ones back
     """
     def __init__(self, inputs, current):
         self.inputs = inputs
         self.current = current
+        self._gap_index = None
+        self._store_key = None
+        self._stored = None
+        self._dirty = False
         super(FeatureCache, self).__init__()
 
+    def _stored_features(self):
+        """
+        Dictionary from EDU identifiers to their feature values
+        in the store (None if there is no store)
+        """
+        store = self.inputs.feature_store
+        if store is None:
+            return None
+        if self._stored is None:
+            self._store_key = store.key(_doc_hash(self.current))
+            self._stored = store.get(self._store_key)
+        return self._stored
+
     def __getitem__(self, edu):
         if edu.identifier() == ROOT:
             return KeyGroup('fake root group', [])
@@ -1140,10 +1335,26 @@ class FeatureCache(dict):
             return super(FeatureCache, self).__getitem__(edu)
         else:
             vec = SingleEduKeys(self.inputs)
-            vec.fill(self.current, edu)
+            stored = self._stored_features()
+            values = None if stored is None else stored.get(edu.identifier())
+            if values is None:
+                vec.fill(self.current, edu)
+                if stored is not None:
+                    stored[edu.identifier()] = dict(vec)
+                    self._dirty = True
+            else:
+                vec.update(values)
             self[edu] = vec
             return vec
 
+    def save(self):
+        """
+        Save any newly computed features to the store
+        """
+        if self._dirty:
+            self.inputs.feature_store.put(self._store_key, self._stored)
+            self._dirty = False
+
     def expire(self, edu):
         """
         Remove an edu from the cache if it's in there
@@ -1151,6 +1362,14 @@ class FeatureCache(dict):
         if edu in self:
             del self[edu]
 
+    def gap_index(self):
+        """
+        The `EduGapIndex` for the current document (built on first use)
+        """
+        if self._gap_index is None:
+            self._gap_index = EduGapIndex(self.current.doc, self)
+        return self._gap_index
+
 # ---------------------------------------------------------------------
 # extraction generators
 # ---------------------------------------------------------------------
@@ -1161,12 +1380,13 @@ def _get_unit_key(inputs, key):
     Given the key for what is presumably a discourse level or
     unannotated document, return the key for for its unit-level
     equivalent.
+
+    The input corpus must be a `Corpus` (see `_with_corpus_index`)
     """
     if key.annotator is None:
-        twins = [k for k in inputs.corpus if
-                 k.doc == key.doc and
-                 k.subdoc == key.subdoc and
-                 k.stage == 'units']
+        twins = inputs.corpus.select(doc=key.doc,
+                                     subdoc=key.subdoc,
+                                     stage='units')
         return twins[0] if twins else None
     else:
         twin = copy.copy(key)
@@ -1174,6 +1394,17 @@ def _get_unit_key(inputs, key):
         return twin if twin in inputs.corpus else None
 
 
+def _with_corpus_index(inputs):
+    """
+    The same feature inputs, with the corpus turned into a `Corpus`
+    if it is a plain dictionary, so that its keys are indexed once
+    for all the documents we build environments for
+    """
+    if isinstance(inputs.corpus, Corpus):
+        return inputs
+    return inputs._replace(corpus=Corpus(inputs.corpus))
+
+
 def mk_env(inputs, people, key):
     """
     Pre-process and bundle up a representation of the current document
@@ -1228,15 +1459,9 @@ def relation_dict(doc, quiet=False):
                               type2=relations[pair]),
                   file=sys.stderr)
     # generate fake root links
+    targets = frozenset(rel.target for rel in doc.relations)
     for anno in doc.units:
-        if not educe.stac.is_edu(anno):
-            continue
-        is_target = False
-        for rel in doc.relations:
-            if rel.target == anno:
-                is_target = True
-                break
-        if not is_target:
+        if educe.stac.is_edu(anno) and anno not in targets:
             key = ROOT, anno.identifier()
             relations[key] = ROOT
     return relations
@@ -1252,12 +1477,6 @@ def _extract_pair(env, edu1, edu2):
     return vec
 
 
-def _id_pair(pair):
-    "pair of ids for pair of edus"
-    edu1, edu2 = pair
-    return edu1.identifier(), edu2.identifier()
-
-
 def _mk_high_level_dialogues(current):
     """
     Returns
@@ -1272,17 +1491,22 @@ def _mk_high_level_dialogues(current):
     for edu in edus:
         edus_in_dialogues[edu.dialogue].append(edu)
 
+    # relations within each dialogue (incl. from the fake root)
+    edus_by_id = defaultdict(list)
+    for edu in edus:
+        edus_by_id[edu.identifier()].append(edu)
+    d_relations = defaultdict(dict)
+    for (id1, id2), rel in relation_dict(doc).items():
+        sources = [FakeRootEDU] if id1 == ROOT else edus_by_id.get(id1, [])
+        for edu2 in edus_by_id.get(id2, []):
+            for edu1 in sources:
+                if edu1 is FakeRootEDU or edu1.dialogue == edu2.dialogue:
+                    d_relations[edu2.dialogue][(edu1, edu2)] = rel
+
     # finally, generat the high level dialogues
-    relations = relation_dict(doc)
     dialogues = sorted(edus_in_dialogues, key=lambda x: x.span)
     for dia in dialogues:
-        d_edus = edus_in_dialogues[dia]
-        d_relations = {}
-        for pair in itr.product([FakeRootEDU] + d_edus, d_edus):
-            rel = relations.get(_id_pair(pair))
-            if rel is not None:
-                d_relations[pair] = rel
-        yield Dialogue(dia, d_edus, d_relations)
+        yield Dialogue(dia, edus_in_dialogues[dia], d_relations[dia])
 
 
 def mk_envs(inputs, stage):
@@ -1293,6 +1517,7 @@ def mk_envs(inputs, stage):
     The environment pools together all the information we
     have on a single document
     """
+    inputs = _with_corpus_index(inputs)
     people = get_players(inputs)
     for key in inputs.corpus:
         if key.stage != stage:
@@ -1310,35 +1535,150 @@ def mk_high_level_dialogues(inputs, stage):
             yield dia
 
 
-def extract_pair_features(inputs, stage):
+def _extract_doc_pairs(env, policies=None):
+    """
+    Extraction for all relevant pairs in the document of an
+    environment (generator)
+    """
+    for dia in _mk_high_level_dialogues(env.current):
+        for edu1, edu2 in dia.edu_pairs(policies):
+            yield _extract_pair(env, edu1, edu2)
+    env.sf_cache.save()
+
+
+def extract_pair_features(inputs, stage, policies=None, jobs=1):
     """
     Extraction for all relevant pairs in a document
     (generator)
+
+    If pruning policies are given, only the pairs they keep
+    are relevant (see `Dialogue.edu_pairs`)
+
+    If `jobs` is more than 1, see `extract_parallel`
     """
-    for env in mk_envs(inputs, stage):
-        for dia in _mk_high_level_dialogues(env.current):
-            for edu1, edu2 in dia.edu_pairs():
-                yield _extract_pair(env, edu1, edu2)
+    extract = partial(_extract_doc_pairs, policies=policies)
+    if jobs > 1:
+        return extract_parallel(inputs, stage, extract, jobs)
+    return (vec for env in mk_envs(inputs, stage) for vec in extract(env))
 
 # ---------------------------------------------------------------------
 # extraction generators (single edu)
 # ---------------------------------------------------------------------
 
 
-def extract_single_features(inputs, stage):
+def _extract_doc_singles(env):
+    """
+    Return a dictionary for each EDU in the document of an
+    environment (generator)
+    """
+    doc = env.current.doc
+    # skip any documents which are not yet annotated
+    if env.current.unitdoc is None:
+        return
+    edus = [unit for unit in doc.units if educe.stac.is_edu(unit)]
+    for edu in edus:
+        yield env.sf_cache[edu]
+    env.sf_cache.save()
+
+
+def extract_single_features(inputs, stage, jobs=1):
     """
     Return a dictionary for each EDU
+
+    If `jobs` is more than 1, see `extract_parallel`
     """
-    for env in mk_envs(inputs, stage):
-        doc = env.current.doc
-        # skip any documents which are not yet annotated
-        if env.current.unitdoc is None:
-            continue
-        edus = [unit for unit in doc.units if educe.stac.is_edu(unit)]
-        for edu in edus:
-            vec = SingleEduKeys(env.inputs)
-            vec.fill(env.current, edu)
-            yield vec
+    if jobs > 1:
+        return extract_parallel(inputs, stage, _extract_doc_singles, jobs)
+    return (vec for env in mk_envs(inputs, stage)
+            for vec in _extract_doc_singles(env))
+
+# ---------------------------------------------------------------------
+# extraction generators (parallel)
+# ---------------------------------------------------------------------
+
+
+class FeatureRow(object):
+    """
+    Feature values for one instance, as already one-hot encoded by
+    `KeyGroup.one_hot_values_gen`.
+
+    This is what comes back from the worker processes in
+    `extract_parallel`: a plain list of (feature name, value) pairs
+    is cheap to send between processes, whereas the key groups hold
+    on to the document they were extracted from. Like the key groups
+    it stands for, it can be fed to a `KeyGroupVectorizer`
+    """
+    def __init__(self, values):
+        self.values = values
+
+    def one_hot_values_gen(self, suffix=''):
+        """
+        The feature values for this instance (generator)
+        """
+        for feature, featval in self.values:
+            yield feature + suffix, featval
+
+
+# state shared by the worker processes of `extract_parallel`
+_JOB_STATE = {}
+
+
+def _init_extract_job(inputs, people, extract):
+    """
+    Set up a worker process for `extract_parallel`
+    """
+    _JOB_STATE['inputs'] = inputs
+    _JOB_STATE['people'] = people
+    _JOB_STATE['extract'] = extract
+
+
+def _extract_job(key):
+    """
+    Feature rows for a single document for `extract_parallel`
+    (module-level so that it can be sent to worker processes)
+    """
+    env = mk_env(_JOB_STATE['inputs'], _JOB_STATE['people'], key)
+    return [FeatureRow(list(vec.one_hot_values_gen()))
+            for vec in _JOB_STATE['extract'](env)]
+
+
+def extract_parallel(inputs, stage, extract, jobs):
+    """
+    Apply a per-document extraction function (from a `DocEnv` to
+    key groups) to each document in the given stage, in a pool of
+    `jobs` worker processes (generator of `FeatureRow`)
+
+    Rows are generated as the documents are done, but always in the
+    same order as the serial extraction would produce them, so
+    that fitting a `KeyGroupVectorizer` on them gives the same
+    vocabulary (and the same ids) either way.
+    `extract` must be picklable (eg. a module-level function or a
+    `functools.partial` of one)
+
+    Mind the memory: every worker is handed all of `inputs` (the
+    corpus, its parses and the lexicons) when the pool starts. With
+    the 'fork' start method (the default on Linux) workers inherit
+    the parent's copy, with pages only duplicated as they are written
+    to (which reference counting does for any object a worker looks
+    at). With 'spawn' or 'forkserver' (eg. on macOS and Windows),
+    `inputs` is pickled and rebuilt in each worker. Either way, expect
+    up to `jobs + 1` times the memory of a serial run.
+    """
+    keys = [k for k in inputs.corpus if k.stage == stage]
+    if not keys:
+        return
+    inputs = _with_corpus_index(inputs)
+    people = get_players(inputs)
+    pool = multiprocessing.Pool(min(jobs, len(keys)),
+                                _init_extract_job,
+                                (inputs, people, extract))
+    try:
+        for rows in pool.imap(_extract_job, keys):
+            for row in rows:
+                yield row
+    finally:
+        pool.close()
+        pool.join()
 
 # ---------------------------------------------------------------------
 # input readers
@@ -1441,10 +1781,15 @@ def read_corpus_inputs(args):
     """
     Read and filter the part of the corpus we want features for
     """
+    cache_dir = getattr(args, 'cache_dir', None)
     reader = educe.stac.Reader(args.corpus)
-    anno_files = reader.filter(reader.files(),
+    all_files = reader.files(filters=educe.util.doc_filters(args),
+                             cache_dir=cache_dir)
+    anno_files = reader.filter(all_files,
                                mk_is_interesting(args, args.single))
-    corpus = reader.slurp(anno_files, verbose=True)
+    corpus = reader.slurp(anno_files, verbose=True,
+                          workers=getattr(args, 'workers', None),
+                          cache_dir=cache_dir)
 
     if not args.ignore_cdus:
         strip_cdus(corpus, mode=args.strip_mode)
@@ -1466,4 +1811,5 @@ def read_corpus_inputs(args):
                         lexicons=LEXICONS,
                         pdtb_lex=pdtb_lex,
                         verbnet_entries=verbnet_entries,
-                        inquirer_lex=inq_lex)
+                        inquirer_lex=inq_lex,
+                        feature_store=mk_feature_store(args))
@@ -54,6 +54,7 @@ class BasicRfc(object):
         self._graph = graph
         self._nodes = graph.first_outermost_dus()
         self._points = self._frontier_points(self._nodes)
+        self._closures = dict()
 
     def _build_frontier(self, last):
         """
@@ -80,15 +81,50 @@ class BasicRfc(object):
             if current in points:
                 candidates.extend(points[current])
 
+    def _closure(self, start):
+        """
+        Return the set of nodes reachable from the given one by
+        following frontier points (ie. the frontier generated by
+        `_build_frontier_from([start])`, as a set).
+
+        The frontier points do not change, so these are memoised,
+        and computing one reuses those of any node already done
+        """
+        closures = self._closures
+        if start in closures:
+            return closures[start]
+        points = self._points
+        res = set([start])
+        candidates = collections.deque([start])
+        while candidates:
+            current = candidates.popleft()
+            for nxt in points.get(current, ()):
+                if nxt in res:
+                    continue
+                elif nxt in closures:
+                    res.update(closures[nxt])
+                else:
+                    res.add(nxt)
+                    candidates.append(nxt)
+        closures[start] = frozenset(res)
+        return closures[start]
+
+    def frontier_set(self, last):
+        """
+        Return the set of nodes on the right frontier with the
+        given node as last (the same nodes as `frontier` gives for
+        the whole graph, but for any point in it)
+        """
+        return self._closure(last)
+
     def _is_on_frontier(self, last, node):
         """
         Return True if node is on the right frontier as
         represented by the pair points/last.
 
-        This uses `build_frontier`
+        This uses `frontier_set`
         """
-        return any(fnode == node for fnode in
-                   self._build_frontier(last))
+        return node in self.frontier_set(last)
 
     def _is_incoming_to(self, node, lnk):
         'true if a given link has the given node as target'
@@ -148,16 +184,18 @@ class BasicRfc(object):
         if len(nodes) < 2:
             return list()
 
+        # the frontier is computed once per node (as a set) rather
+        # than once per incoming link
         violations = list()
-        for i, new_node in enumerate(nodes):
-            last_node = nodes[i-1] if i>0 else None
+        frontier = frozenset()
+        for new_node in nodes:
             for lnk in graph.links(new_node):
                 if not self._is_incoming_to(new_node, lnk):
                     continue
                 src_node, _ = graph.rel_links(lnk)
-                if (last_node is None
-                    or not self._is_on_frontier(last_node, src_node)):
+                if src_node not in frontier:
                     violations.append(lnk)
+            frontier = self.frontier_set(new_node)
 
         return violations
 
@@ -201,3 +239,11 @@ class ThreadedRfc(BasicRfc):
         the given node as last.
         """
         return self._build_frontier_from(self._last[last])
+
+    def frontier_set(self, last):
+        """
+        Return the set of nodes on the right frontier with
+        the given node as last.
+        """
+        return frozenset().union(*[self._closure(x)
+                                   for x in self._last[last]])
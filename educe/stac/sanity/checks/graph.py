@@ -261,7 +261,7 @@ def dialogue_graphs(k, doc, contexts):
         dialogues[ctx.dialogue].append(anno)
     graphs = {}
     for dia, annos in dialogues.items():
-        keep = lambda x, d_annos=annos: in_dialogue(d_annos, x)
+        keep = lambda x, d_annos=frozenset(annos): in_dialogue(d_annos, x)
         graphs[dia] = egr.Graph.from_doc({k: doc}, k, pred=keep)
     return graphs
 
@@ -21,7 +21,7 @@ import sys
 import tempfile
 
 from educe import stac
-from educe.corpus import FileId
+from educe.corpus import Corpus, FileId
 import educe.graph
 from educe.stac import graph as egr
 from educe.stac.corpus import (METAL_STR, twin_key)
@@ -105,9 +105,12 @@ def copy_parses(settings):
     "Copy relevant stanford parser outputs from corpus to report"
     output_dir = settings.output_dir
 
-    docs = set(k.doc for k in settings.corpus)
+    corpus = settings.corpus
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus(corpus)
+    docs = corpus.values_of('doc')
     for doc in docs:
-        subdocs = set(k.subdoc for k in settings.corpus if k.doc == doc)
+        subdocs = corpus.values_of('subdoc', doc=doc)
         if subdocs:
             k = FileId(doc=doc,
                        subdoc=list(subdocs)[0],
@@ -270,24 +273,31 @@ class SanityChecker(object):
         self.corpus_dir = args.corpus
         self.corpus = None
         self.contexts = None
-        self.__init_read_corpus(is_interesting, self.corpus_dir)
+        self.__init_read_corpus(is_interesting,
+                                educe.util.doc_filters(args),
+                                self.corpus_dir,
+                                args)
         self.__init_set_output(args.output)
         self.report = HtmlReport(self.anno_files, self.output_dir)
         self.draw = args.draw
 
-    def __init_read_corpus(self, is_interesting, corpus_dir):
+    def __init_read_corpus(self, is_interesting, filters, corpus_dir,
+                           args):
         """
         Read the corpus specified in our args
         """
+        cache_dir = getattr(args, 'cache_dir', None)
         reader = stac.Reader(corpus_dir)
-        all_files = reader.files()
+        all_files = reader.files(filters=filters, cache_dir=cache_dir)
         self.anno_files = reader.filter(all_files, is_interesting)
         interesting = list(self.anno_files)  # or list(self.anno_files.keys())
         for key in interesting:
             ukey = twin_key(key, 'unannotated')
             if ukey in all_files:
                 self.anno_files[ukey] = all_files[ukey]
-        self.corpus = reader.slurp(self.anno_files, verbose=True)
+        self.corpus = reader.slurp(self.anno_files, verbose=True,
+                                   workers=getattr(args, 'workers', None),
+                                   cache_dir=cache_dir)
         self.contexts = {k: Context.for_edus(self.corpus[k])
                          for k in self.corpus}
 
@@ -386,6 +396,7 @@ def main():
     arg_parser.add_argument('--no-draw', action='store_true',
                             dest='draw', default=True,
                             help='Do not draw relations graph')
+    educe.util.add_cache_args(arg_parser)
     educe.util.add_corpus_filters(arg_parser)
     args = arg_parser.parse_args()
 
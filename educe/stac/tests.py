@@ -18,7 +18,18 @@ import subprocess
 import educe.tests
 import educe.stac.graph as stac_gr
 from educe import annotation, corpus, stac
-from educe.stac import fake_graph
+from educe.annotation import Span
+from educe.stac import fake_graph, fusion
+from educe.stac.context import Context, sorted_first_widest
+from educe.stac.annotation import speaker, turn_id
+from educe.stac.context import edus_in_span, turns_in_span
+from educe.stac.fusion import FakeRootEDU, fuse_edus
+from educe.external.corenlp import CoreNlpDocument
+from educe.external.postag import RawToken, Token
+from educe.learning.keygroup_vectorizer import KeyGroupVectorizer
+from educe.stac.learning.features import (EduGapIndex, FeatureInput,
+                                          PairSubgroup_Gap,
+                                          extract_single_features)
 from educe.stac.rfc import BasicRfc, ThreadedRfc
 from educe.corpus import FileId
 from educe.stac.util.output import mk_parent_dirs
@@ -285,6 +296,125 @@ def test_first_outermost_dus():
     expected = ['c3', 'c1','e2','e1','e3', 'c2', 'e4', 'e5' ]
     assert got == [ ids[x] for x in expected ]
 
+def test_context_shared_tables():
+    "contexts of the same document share their turn lists"
+    doc = fake_graph.LightGraph('#Aab Bc / Sab').get_doc()
+    contexts = Context.for_edus(doc)
+    edus = sorted(contexts, key=lambda x: x.span)
+    ctx1, ctx2, ctx3 = [contexts[x] for x in edus]
+    turns = sorted_first_widest(x for x in doc.units if stac.is_turn(x))
+    assert ctx1.doc_turns == turns
+    assert ctx1.dialogue_turns == turns
+    assert ctx1.doc_turns is ctx3.doc_turns
+    assert ctx1.dialogue_turns is ctx2.dialogue_turns
+    assert ctx2.turn_edus == [edus[1]]
+    assert ctx3.tstar.span == ctx3.turn.span
+
+def test_fuse_edus():
+    "fusion rewrites references without touching the original document"
+    doc = fake_graph.LightGraph('#Aabc / x(bc) / Sax Cbc').get_doc()
+    units = list(doc.units)
+    fused = fuse_edus(doc, doc, None)
+    assert doc.units == units
+    assert all(not isinstance(x, fusion.EDU) for x in doc.units)
+    edus = [x for x in fused.units if isinstance(x, fusion.EDU)]
+    assert len(edus) == 3
+    for rel in fused.relations:
+        assert rel.source in fused.annotations()
+        assert rel.target in fused.annotations()
+    for schema in fused.schemas:
+        assert all(x in edus for x in schema.members)
+    assert [x.local_id() for x in edus] ==\
+        [x.local_id() for x in sorted(units, key=lambda x: x.span)
+         if stac.is_edu(x)]
+
+class QuestionCache(dict):
+    """
+    Stand-in for a `FeatureCache`: the single EDU features of an EDU
+    only say if it is one of the given questions
+    """
+    def __init__(self, doc, questions):
+        super(QuestionCache, self).__init__()
+        self.index = EduGapIndex(doc, self)
+        self.questions = questions
+
+    def __getitem__(self, edu):
+        return {'is_question': edu.local_id() in self.questions}
+
+    def gap_index(self):
+        return self.index
+
+def old_gap_features(doc, cache, edu1, edu2):
+    """
+    The gap features, computed by scanning the document for the EDUs
+    and turns in between (taking the turns in textual order)
+    """
+    inner_edus = edus_in_span(doc, edu1.text_span().merge(edu2.text_span()))
+    inner_edus = [x for x in inner_edus if x not in (edu1, edu2)]
+    turns = turns_in_span(doc, Span(edu1.turn.text_span().char_end,
+                                    edu2.turn.text_span().char_start))
+    turns = sorted(turns, key=lambda x: x.text_span())
+    if edu1 is FakeRootEDU:
+        tid1 = min(turn_id(x) for x in edu2.dialogue_turns)
+        tid1 = (tid1[0] - 1,) + tid1[1:]
+    else:
+        tid1 = turn_id(edu1.turn)
+    tids = [tid1] + [turn_id(t) for t in turns] + [turn_id(edu2.turn)]
+    return {'num_edus_between': len(inner_edus),
+            'num_speakers_between': len(set(speaker(t) for t in turns)),
+            'num_nonling_tstars_between':
+            len([1 for tid_i, tid_j in zip(tids[:-1], tids[1:])
+                 if tid_j[0] - tid_i[0] > 1]),
+            'has_inner_question':
+            any(cache[x]['is_question'] for x in inner_edus)}
+
+def test_gap_index():
+    "the gap features match a scan of the document"
+    # turns (one per EDU) are numbered after their EDU, so that the
+    # missing letters make for non-linguistic turns
+    doc = fake_graph.LightGraph('#Aabeh Bcgj Cdk').get_doc()
+    for anno in doc.units:
+        if stac.is_turn(anno):
+            anno.features['Identifier'] = str(anno.features['Identifier'])
+    fused = fuse_edus(doc, doc, None)
+    cache = QuestionCache(fused, ['du_2', 'du_6'])
+    edus = sorted([x for x in fused.units if stac.is_edu(x)],
+                  key=lambda x: x.span)
+    pairs = [(FakeRootEDU, x) for x in edus]
+    pairs.extend((x, y) for x in edus for y in edus if x != y)
+    for edu1, edu2 in pairs:
+        vec = PairSubgroup_Gap(cache)
+        vec.fill(None, edu1, edu2)
+        expected = old_gap_features(fused, cache, edu1, edu2)
+        got = dict((k, vec[k]) for k in expected)
+        assert got == expected, (edu1, edu2)
+
+def test_parallel_extraction():
+    "extracting features with several jobs matches the serial run"
+    corpus = {}
+    for i, src in enumerate(['#Aab Bc / Sab', '#Aa Bbcd / Sbc Cad']):
+        doc = fake_graph.LightGraph(src).get_doc()
+        for anno in doc.units:
+            if stac.is_turn(anno):
+                anno.features['Identifier'] = str(anno.features['Identifier'])
+        key = FileId('d%d' % i, '01', 'units', 'GOLD')
+        doc.set_origin(key)
+        tokens = [Token(RawToken(doc.text(x.span), 'NN'), x.span)
+                  for x in doc.units if stac.is_edu(x)]
+        corpus[key] = fuse_edus(doc, doc, tokens)
+    parses = dict((k, CoreNlpDocument([], [], [], [])) for k in corpus)
+    inputs = FeatureInput(corpus=corpus, postags=None, parses=parses,
+                          lexicons=[], pdtb_lex={}, verbnet_entries=[],
+                          inquirer_lex={})
+    results = []
+    for jobs in (1, 2):
+        vzer = KeyGroupVectorizer()
+        rows = vzer.fit_transform(extract_single_features(inputs, 'units',
+                                                          jobs=jobs))
+        results.append((vzer.vocabulary_, rows))
+    assert results[0][1]
+    assert results[0] == results[1]
+
 def mk_graphs(src, dump=None):
     """ Returns educe.fake_graph.LightGraph and educe.stac.Graph
         for given LightGraph source string
@@ -404,3 +534,12 @@ class ThreadedRfcTest(BasicRfcTest):
         multi_violations = self.violations(graph)
         self.assertNotIn(lg.get_edge('b', 'c'), multi_violations)
         self.assertNotIn(lg.get_edge('a', 'c'), multi_violations)
+
+def test_frontier_set():
+    "the frontier set, with the last node as last, is the frontier"
+    for src in ['#Aabcd / x(bc) / Saxd Cbc', '#Aa Bb Cc / Sac bc',
+                '#Aabc / CabSc Sac']:
+        _, graph = mk_graphs(src)
+        last = graph.first_outermost_dus()[-1]
+        for rfc in [BasicRfc(graph), ThreadedRfc(graph)]:
+            assert rfc.frontier_set(last) == frozenset(rfc.frontier())
@@ -60,25 +60,50 @@ def check_easy_settings(args):
     print(guess_report.format(**args.__dict__), file=sys.stderr)
 
 
+def _slurp_or_open(reader, anno_files, args, verbose, lazy):
+    """
+    Read the given files (all at once, or lazily if `lazy` is set; see
+    `educe.corpus.Reader.open`)
+    """
+    cache_dir = getattr(args, 'cache_dir', None)
+    if lazy:
+        return reader.open(anno_files, cache_dir=cache_dir)
+    return reader.slurp(anno_files, verbose,
+                        workers=getattr(args, 'workers', None),
+                        cache_dir=cache_dir)
+
+
 def read_corpus(args,
                 preselected=None,
-                verbose=True):
+                verbose=True,
+                lazy=False):
     """
     Read the section of the corpus specified in the command line arguments.
+
+    If `lazy` is set, return a read-only `educe.corpus.LazyCorpus`
+    which only parses documents as they are looked up (use this if
+    you work on one document at a time and do not modify them)
     """
     is_interesting = educe.util.mk_is_interesting(args,
                                                   preselected=preselected)
+    filters = educe.util.mk_field_filters(args, preselected=preselected)
     reader = educe.stac.Reader(args.corpus)
-    anno_files = reader.filter(reader.files(), is_interesting)
-    return reader.slurp(anno_files, verbose)
+    all_files = reader.files(filters=filters,
+                             cache_dir=getattr(args, 'cache_dir', None))
+    anno_files = reader.filter(all_files, is_interesting)
+    return _slurp_or_open(reader, anno_files, args, verbose, lazy)
 
 
-def read_corpus_with_unannotated(args, verbose=True):
+def read_corpus_with_unannotated(args, verbose=True, lazy=False):
     """
     Read the section of the corpus specified in the command line arguments.
+    See `read_corpus` for `lazy`
     """
     reader = educe.stac.Reader(args.corpus)
-    all_files = reader.files()
+    # we want the unannotated twins of whatever stage/annotator is
+    # asked for, so we can only narrow the search down to documents
+    all_files = reader.files(filters=educe.util.doc_filters(args),
+                             cache_dir=getattr(args, 'cache_dir', None))
     is_interesting = educe.util.mk_is_interesting(args)
     anno_files = reader.filter(all_files, is_interesting)
     unannotated_twins = frozenset(educe.stac.twin_key(k, 'unannotated')
@@ -86,7 +111,7 @@ def read_corpus_with_unannotated(args, verbose=True):
     for key in unannotated_twins:
         if key in all_files:
             anno_files[key] = all_files[key]
-    return reader.slurp(anno_files, verbose=verbose)
+    return _slurp_or_open(reader, anno_files, args, verbose, lazy)
 
 
 def get_output_dir(args, default_overwrite=False):
@@ -154,6 +179,7 @@ def add_usual_input_args(parser,
     parser.add_argument('corpus', metavar='DIR',
                         nargs='?',
                         help='corpus dir')
+    educe.util.add_cache_args(parser)
     if doc_subdoc_required:
         doc_help = 'document'
         subdoc_help = 'subdocument'
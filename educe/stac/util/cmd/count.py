@@ -408,6 +408,6 @@ def main(args):
         acounts = count_by_annotator(corpus)
         print(report(dcounts, gcounts, gcounts2, acounts))
     else:
-        # new stats
-        corpus = read_corpus_with_unannotated(args, verbose=True)
+        # new stats (one document at a time, read-only)
+        corpus = read_corpus_with_unannotated(args, verbose=True, lazy=True)
         report_on_corpus(corpus)
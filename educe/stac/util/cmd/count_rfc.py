@@ -85,7 +85,7 @@ def process_doc_power(corpus, key, strip=False):
         for name, method in rfc_methods[1:]:
             rfc = method(dia_graph)
             for i, last in enumerate(sorted_edus):
-                frontier = rfc._build_frontier(last)
+                frontier = rfc.frontier_set(last)
                 frontier = list(n for n in frontier if dia_graph.is_edu(n))
                 # Corner case: backwards links
                 frontier = list(n for n in frontier if
@@ -179,7 +179,7 @@ def main(args):
     """
     output_dir = get_output_dir(args)
     corpus = read_corpus(args, verbose=True,
-        preselected=dict(stage=['discourse']))
+        preselected=dict(stage=['discourse']), lazy=True)
 
     if args.mode == 'violations':
         main_violations(corpus, strip=args.strip_cdus)
@@ -8,13 +8,24 @@
 Tests for educe
 """
 
+import codecs
+import os
+import shutil
+import tempfile
 import unittest
+import xml.etree.ElementTree as ET
+from xml.dom import minidom
 
+from educe import glozz
+from educe.cache import FeatureStore, ListingCache, ParseCache
+from educe.corpus import Corpus, FileId, Reader
 from educe.annotation import (Span, RelSpan,
                               Annotation,
                               Unit, Relation, Schema, Document)
 import educe.graph as educe
 from   educe.graph import EnclosureGraph
+from educe.learning.pair_policies import (MaxDistance, SameOrAdjacent,
+                                          coverage, keeps)
 from educe.util import relative_indices
 
 
@@ -166,6 +177,32 @@ class EnclosureTest(unittest.TestCase):
         self.assertEqual([s_1_5], g.outside(s_2_4))
         self.assertEqual([s_1_5, s_2_4], g.outside(s_3_4))
 
+    def test_duplicate_spans(self):
+        """
+        without a key, nodes with the same span do not enclose each
+        other; a node of the same type as the enclosed one in between
+        is enough to get the twist
+        """
+        c_0_9 = Unit('c1', Span(0, 9), 'C', {})
+        c_0_2 = Unit('c2', Span(0, 2), 'C', {})
+        a_0_2 = Unit('a1', Span(0, 2), 'A', {})
+        a_0_1 = Unit('a2', Span(0, 1), 'A', {})
+        g = EnclosureGraph([c_0_9, c_0_2, a_0_2, a_0_1])
+        self.assertEqual([('a1', 'a2'), ('c1', 'a1'), ('c1', 'a2'),
+                          ('c1', 'c2'), ('c2', 'a2')],
+                         sorted(g.edges()))
+
+    def test_crossing_spans(self):
+        s0_4 = NullAnno(0, 4, 'a')
+        s2_6 = NullAnno(2, 6, 'b')
+        s2_3 = NullAnno(2, 3, 'c')
+        s0_6 = NullAnno(0, 6, 'd')
+        g = EnclosureGraph([s0_4, s2_6, s2_3, s0_6])
+        self.assertEqual([s0_4, s2_6], g.inside(s0_6))
+        self.assertEqual([s2_3], g.inside(s0_4))
+        self.assertEqual([s2_3], g.inside(s2_6))
+        self.assertEqual([s0_4, s2_6], g.outside(s2_3))
+
 
 # ---------------------------------------------------------------------
 # annotations
@@ -213,6 +250,361 @@ def test_members():
         assert sp.char_start >= doc_sp.char_start
         assert sp.char_end   <= doc_sp.char_end
 
+def test_span_index():
+    spans = [(0, 20), (2, 4), (3, 9), (1, 10), (12, 13), (4, 12), (7, 14),
+             (9, 9), (10, 12), (13, 20)]
+    units = [TestUnit('u%d' % i, start, end)
+             for i, (start, end) in enumerate(spans)]
+    for i, unit in enumerate(units):
+        unit.type = 'odd' if i % 2 else 'even'
+    doc = TestDocument(units, [], [], "why hello there!")
+    idx = doc.span_index()
+    for start in range(0, 21):
+        for end in range(start, 21):
+            span = Span(start, end)
+            assert idx.enclosed(span) ==\
+                [u for u in units if span.encloses(u.span)]
+            assert idx.containing(span) ==\
+                [u for u in units if u.span.encloses(span)]
+            assert idx.overlapping(span) ==\
+                [u for u in units if span.overlaps(u.span)]
+            assert idx.enclosed(span, ['odd']) ==\
+                [u for u in units
+                 if span.encloses(u.span) and u.type == 'odd']
+
+    # index follows changes to the units (the list is not copied)
+    gone = units[1]
+    doc.units.remove(gone)
+    assert gone not in units
+    assert doc.span_index() is not idx
+    assert gone not in doc.span_index().enclosed(Span(0, 20))
+    idx = doc.span_index()
+    assert doc.span_index() is idx
+    units[2].span = Span(30, 40)
+    assert doc.span_index().containing(Span(31, 32)) == [units[2]]
+    units[2].span.char_end = 50
+    assert doc.span_index().containing(Span(45, 46)) == [units[2]]
+
+    # but not changes to other documents
+    idx = doc.span_index()
+    other = TestDocument([TestUnit('v1', 0, 1)], [], [], "")
+    other.span_index()
+    other.units[0].span.char_end = 2
+    other.units[0]._anno_id = 'v2'
+    assert doc.span_index() is idx
+
+def test_text_span_cache():
+    u1 = TestUnit('u1', 2, 4)
+    u2 = TestUnit('u2', 3, 9)
+    u3 = TestUnit('u3', 12, 13)
+    s1 = TestSchema('s1', ['u1', 'u2'], [], [])
+    s2 = TestSchema('s2', ['u3'], [], ['s1'])
+    r1 = TestRelation('r1', 's1', 'u3')
+    doc = TestDocument([u1, u2, u3], [r1], [s1, s2], "why hello there!")
+    assert s2.text_span() == Span(2, 13)
+    assert r1.text_span() == Span(2, 13)
+    assert doc.text_span() == Span(2, 13)
+
+    # mutating spans (in place or not) or members invalidates the cache
+    u1.span.char_start = 1
+    assert s2.text_span() == Span(1, 13)
+    u3.span = Span(12, 20)
+    assert r1.text_span() == Span(1, 20)
+    r1.target = u2
+    assert r1.text_span() == Span(1, 9)
+    doc.units.append(TestUnit('u4', 25, 30))
+    assert doc.text_span() == Span(1, 30)
+    s1.members.append(doc.units[-1])
+    assert s2.text_span() == Span(1, 30)
+    s1.members[-1].span.char_end = 35
+    assert s1.text_span() == Span(1, 35)
+
+    # cycles are tolerated
+    s3 = TestSchema('s3', ['u1'], [], ['s4'])
+    s4 = TestSchema('s4', ['u3'], [], ['s3'])
+    TestDocument([u1, u3], [], [s3, s4], "why hello there!")
+    assert s3.text_span() == Span(1, 20)
+    assert s4.text_span() == Span(1, 20)
+
+def test_get_annotation():
+    u1 = TestUnit('u1', 2, 4)
+    u2 = TestUnit('u2', 3, 9)
+    s1 = TestSchema('s1', ['u1', 'u2'], [], [])
+    r1 = TestRelation('r1', 'u1', 'u2')
+    doc = TestDocument([u1, u2], [r1], [s1], "why hello there!")
+    assert doc.get_annotation('u2') is u2
+    assert doc.get_annotation('r1') is r1
+    assert doc.get_annotation('s1') is s1
+    assert doc.get_annotation('u3') is None
+
+    # the index follows changes to the document
+    u3 = TestUnit('u3', 12, 13)
+    doc.units.append(u3)
+    assert doc.get_annotation('u3') is u3
+    doc.relations = []
+    assert doc.get_annotation('r1') is None
+    u2._anno_id = 'u2b'
+    assert doc.get_annotation('u2') is None
+    assert doc.get_annotation('u2b') is u2
+
+    # first match wins
+    u4 = TestUnit('u1', 0, 1)
+    doc.units.append(u4)
+    assert doc.get_annotation('u1') is u1
+
+# ---------------------------------------------------------------------
+# corpus
+# ---------------------------------------------------------------------
+
+def test_corpus_select():
+    keys = [FileId(doc=d, subdoc=s, stage=st, annotator=a)
+            for d in ['d1', 'd2']
+            for s in ['01', '02']
+            for st, a in [('unannotated', None),
+                          ('units', 'bob'),
+                          ('discourse', 'bob'),
+                          ('discourse', 'alice')]]
+    corpus = Corpus((k, None) for k in keys)
+    assert corpus.select() == keys
+    assert corpus.select(doc='d2', subdoc='01', stage='discourse') ==\
+        [k for k in keys if k.doc == 'd2' and k.subdoc == '01' and
+         k.stage == 'discourse']
+    assert corpus.select(annotator=None) ==\
+        [k for k in keys if k.annotator is None]
+    assert corpus.select(doc='d3') == []
+    assert corpus.values_of('subdoc', doc='d1') == frozenset(['01', '02'])
+    assert corpus.values_of('annotator') == frozenset([None, 'bob', 'alice'])
+
+    # the index follows changes to the corpus
+    del corpus[keys[0]]
+    assert keys[0] not in corpus.select(doc='d1')
+    new_key = FileId(doc='d3', subdoc='01', stage='units', annotator='bob')
+    corpus[new_key] = None
+    assert corpus.select(doc='d3') == [new_key]
+
+class CountingReader(Reader):
+    "reader whose documents are just their paths; counts reads"
+    def __init__(self, cfiles):
+        Reader.__init__(self, None)
+        self._cfiles = cfiles
+        self.reads = 0
+
+    def files(self):
+        return self._cfiles
+
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
+        self.reads += len(cfiles)
+        return Corpus(cfiles)
+
+class GlozzReader(Reader):
+    "reader for the Glozz documents it is given"
+    def __init__(self, cfiles):
+        Reader.__init__(self, None)
+        self._cfiles = cfiles
+
+    def files(self):
+        return self._cfiles
+
+    def slurp_subcorpus(self, cfiles, verbose=False, workers=None,
+                        cache_dir=None):
+        return self._slurp_files(glozz.read_annotation_file, cfiles,
+                                 verbose=verbose, workers=workers,
+                                 cache_dir=cache_dir)
+
+def _glozz_summary(doc):
+    "what we compare of a Glozz document"
+    return (doc.text(), doc.hashcode,
+            [(x.local_id(), x.type, x.features, x.metadata)
+             for x in doc.annotations()],
+            [x.span for x in doc.units],
+            [(x.span.t1, x.span.t2) for x in doc.relations],
+            [x.span for x in doc.schemas])
+
+def test_lazy_corpus():
+    keys = [FileId(doc='d1', subdoc=s, stage='units', annotator='bob')
+            for s in ['01', '02', '03']]
+    reader = CountingReader(dict((k, str(k)) for k in keys))
+    corpus = reader.open(max_docs=2)
+    assert len(corpus) == 3
+    assert reader.reads == 0
+    assert sorted(corpus) == sorted(keys)
+    assert corpus.select(subdoc='02') == [keys[1]]
+    assert corpus[keys[0]] == str(keys[0])
+    assert corpus[keys[0]] == str(keys[0])
+    assert reader.reads == 1
+    corpus[keys[1]]
+    corpus[keys[2]]  # evicts keys[0]
+    corpus[keys[1]]
+    assert reader.reads == 3
+    corpus[keys[0]]
+    assert reader.reads == 4
+    assert FileId('d2', None, None, None) not in corpus
+
+def test_slurp_workers():
+    "reading in a pool of processes gives the same corpus"
+    cfiles = {}
+    for i in [3, 1, 2, 0]:
+        name = 'example-units' if i % 2 else 'example-discourse'
+        prefix = os.path.join(_GLOZZ_SAMPLE, name)
+        key = FileId(doc='d%d' % i, subdoc=None, stage=name,
+                     annotator=None)
+        cfiles[key] = (prefix + '.aa', prefix + '.ac')
+    reader = GlozzReader(cfiles)
+    serial = reader.slurp()
+    pooled = reader.slurp(workers=2)
+    assert list(pooled) == list(serial)
+    for key in serial:
+        assert _glozz_summary(pooled[key]) == _glozz_summary(serial[key])
+
+# ---------------------------------------------------------------------
+# glozz
+# ---------------------------------------------------------------------
+
+_GLOZZ_XML = u"""<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<annotations>
+<unit id="u1">
+<metadata><author>b\u00e9a</author><cr\u00e9ation>1</cr\u00e9ation></metadata>
+<characterisation>
+<type>\u00c9nonc\u00e9</type>
+<featureSet><feature name="\u00e9tat">\u00e7a</feature></featureSet>
+</characterisation>
+<positioning><start><singlePosition index="0"/></start>
+<end><singlePosition index="3"/></end></positioning>
+</unit>
+</annotations>
+"""
+
+def test_read_glozz():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'doc.aa')
+        with codecs.open(path, 'w', 'utf-8') as stream:
+            stream.write(_GLOZZ_XML)
+        doc = glozz.read_annotation_file(path)
+        [unit] = doc.units
+        assert unit.type == u'\u00c9nonc\u00e9'
+        assert unit.features == {u'\u00e9tat': u'\u00e7a'}
+        assert unit.metadata[u'cr\u00e9ation'] == u'1'
+    finally:
+        shutil.rmtree(tmpdir)
+
+_GLOZZ_SAMPLE = os.path.join(os.path.dirname(__file__), '..', 'data',
+                             'glozz-sample')
+
+def _minidom_glozz(doc):
+    """
+    Glozz XML for a document, pretty-printed through minidom the way
+    `write_annotation_file` used to do it
+    """
+    string1 = ET.tostring(doc.to_xml(), encoding='utf-8')
+    reparsed = minidom.parseString(string1.replace(b'\n', b''))
+    string2 = reparsed.toprettyxml(indent="", encoding='utf-8')
+    zero = len(minidom.Document().toxml(encoding='utf-8')) + 1
+    return glozz._GLOZZ_DECL + '\n' + string2[zero:].decode('utf-8')
+
+def test_write_glozz():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'doc.aa')
+        for name in ['example-units.aa', 'example-discourse.aa']:
+            sample = os.path.join(_GLOZZ_SAMPLE, name)
+            doc = glozz.read_annotation_file(sample)
+            glozz.write_annotation_file(path, doc)
+            with open(sample, 'rb') as stream:
+                expected = stream.read().replace(b'\r\n', b'\n')
+            with open(path, 'rb') as stream:
+                assert stream.read() == expected, name
+            # values that need escaping (or are dropped)
+            unit = doc.units[0]
+            unit.features[u'\u00e9tat'] = u'<&>"\'\n\u00e7a'
+            unit.metadata['author'] = u'b\u00e9a & <co>\n'
+            glozz.write_annotation_file(path, doc)
+            with codecs.open(path, 'r', 'utf-8') as stream:
+                assert stream.read() == _minidom_glozz(doc), name
+            unit2 = glozz.read_annotation_file(path).units[0]
+            assert unit2.features[u'\u00e9tat'] == u'<&>"\'\u00e7a'
+            assert unit2.metadata['author'] == u'b\u00e9a & <co>'
+    finally:
+        shutil.rmtree(tmpdir)
+
+# ---------------------------------------------------------------------
+# parse cache
+# ---------------------------------------------------------------------
+
+def _read_text(path):
+    "stand-in for a corpus parser"
+    with open(path) as stream:
+        return stream.read()
+
+def test_parse_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmpdir, 'doc.txt')
+        with open(path, 'w') as stream:
+            stream.write('hello')
+        cache = ParseCache(os.path.join(tmpdir, 'cache'), max_size=0)
+        key = cache.key(_read_text, path)
+        assert cache.get(key) is None
+        cache.put(key, _read_text(path))
+        assert cache.get(key) == 'hello'
+
+        # changing the file changes its key
+        with open(path, 'w') as stream:
+            stream.write('hello world')
+        assert cache.key(_read_text, path) != key
+        assert cache.key(_read_text, os.path.join(tmpdir, 'nope')) is None
+
+        cache.evict()
+        assert cache.get(key) is None
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_listing_cache():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        corpus_dir = os.path.join(tmpdir, 'corpus')
+        cache_dir = os.path.join(tmpdir, 'cache')
+        os.makedirs(os.path.join(corpus_dir, 'd1'))
+        with open(os.path.join(corpus_dir, 'x.aa'), 'w'):
+            pass
+        listings = ListingCache(cache_dir, corpus_dir)
+        assert listings.listdir(corpus_dir) == [('d1', True), ('x.aa', False)]
+        assert listings.listdir(os.path.join(corpus_dir, 'nope')) == []
+        listings.save()
+
+        # saved listings are reused until the directory changes
+        listings = ListingCache(cache_dir, corpus_dir)
+        assert listings.listdir(corpus_dir) == [('d1', True), ('x.aa', False)]
+        os.makedirs(os.path.join(corpus_dir, 'd2'))
+        os.utime(corpus_dir, (0, 0))
+        assert listings.listdir(corpus_dir) ==\
+            [('d1', True), ('d2', True), ('x.aa', False)]
+    finally:
+        shutil.rmtree(tmpdir)
+
+def test_feature_store():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        store = FeatureStore(tmpdir, version='1', memory_size=1)
+        key1 = store.key('doc1')
+        entry = store.get(key1)
+        assert entry == {}
+        entry['e1'] = {'num_tokens': 3}
+        store.put(key1, entry)
+        # only in memory until saved, and forgotten when evicted from it
+        store.get(store.key('doc2'))['e2'] = {'num_tokens': 4}
+        store.get(store.key('doc3'))
+        assert store.get(store.key('doc2')) == {}
+        assert store.get(key1) == {'e1': {'num_tokens': 3}}
+
+        # saved entries are there on later runs, for the same version
+        assert FeatureStore(tmpdir, version='1').get(key1) == entry
+        assert FeatureStore(tmpdir, version='2').key('doc1') != key1
+        assert FeatureStore(version='1').get(key1) == {}
+    finally:
+        shutil.rmtree(tmpdir)
+
 # ---------------------------------------------------------------------
 # graph
 # ---------------------------------------------------------------------
@@ -335,6 +727,126 @@ class BasicGraphTest(unittest.TestCase):
         self.assertEqual(xset2,             gr4.edus())
         self.assertEqual(set(['X1', 'X2']), gr4.cdus())
 
+    def test_copy_on_write(self):
+        "copies share structure until either graph is modified"
+        gr = FakeGraph()
+        gr.add_edus(1, 2, 3)
+        gr.add_rel('a', 1, 2)
+        gr.add_rel('b', 2, 3)
+        gr2 = gr.copy(nodeset=set(['1', '2']))
+        self.assertEqual(set(['a']), gr2.relations())
+        self.assertEqual(['a'], gr2.links('2'))
+
+        gr2.del_node('1')
+        self.assertEqual(['1', '2'], gr.links('a'))
+        self.assertEqual(set(['1', '2', '3']), gr.edus())
+        self.assertRaises(educe.AdditionError, gr2.link, '2', 'a')
+
+        gr.unlink('2', 'a')
+        self.assertEqual(['2'], gr2.links('a'))
+        gr2.add_edge_attribute('a', ('type', 'foo'))
+        self.assertEqual(set(['a', 'b']), gr.relations())
+
+    def test_equality(self):
+        "graphs are equal if they have the same nodes, edges and links"
+        def mk_graph(rels):
+            gr = FakeGraph()
+            gr.add_edus(1, 2, 3)
+            for rel in rels:
+                gr.add_rel(*rel)
+            return gr
+        gr = mk_graph([('a', 1, 2), ('b', 2, 3)])
+        self.assertEqual(gr, mk_graph([('b', 2, 3), ('a', 1, 2)]))
+        self.assertEqual(gr, gr.copy())
+        self.assertNotEqual(gr, mk_graph([('a', 1, 2)]))
+        self.assertNotEqual(gr, mk_graph([('a', 1, 2), ('b', 1, 3)]))
+        gr2 = gr.copy()
+        gr2.add_node_attribute('1', ('type', 'not-an-EDU'))
+        self.assertNotEqual(gr, gr2)
+
+    def test_neighbor_order(self):
+        "neighbours come in the order of the links"
+        gr = FakeGraph()
+        gr.add_edus(*range(1, 10))
+        for i in [7, 3, 9, 2, 5]:
+            gr.add_rel('r%d' % i, 1, i)
+        gr.add_cdu('X', [4, 1, 3, 8])
+        self.assertEqual(['7', '3', '9', '2', '5', '4', '8'],
+                         gr.neighbors('1'))
+
+    def test_copy_is_local(self):
+        "copying part of a graph only looks at the edges of that part"
+        gr = FakeGraph()
+        for i in range(50):
+            gr.add_edus(10 * i + 1, 10 * i + 2)
+            gr.add_rel('r%d' % i, 10 * i + 1, 10 * i + 2)
+        gr.copy(nodeset=set(['1']))  # warm up any graph-wide index
+
+        class Lookups(dict):
+            "dictionary that counts lookups and forbids walks"
+            count = 0
+
+            def __getitem__(self, key):
+                Lookups.count += 1
+                return dict.__getitem__(self, key)
+
+            def get(self, key, default=None):
+                Lookups.count += 1
+                return dict.get(self, key, default)
+
+            def _walk(self, *_):
+                raise AssertionError('walked over the whole graph')
+            __iter__ = items = keys = values = _walk
+
+        gr._node_links = Lookups(gr._node_links)
+        gr._edge_links = Lookups(gr._edge_links)
+        gr2 = gr.copy(nodeset=set(['101', '102']))
+        self.assertEqual(set(['101', '102']), gr2.edus())
+        self.assertEqual(set(['r10']), gr2.relations())
+        self.assertTrue(Lookups.count < 20)
+
+    def test_cdu_indexes(self):
+        "containment and components follow changes to the graph"
+        gr = FakeGraph()
+        gr.add_edus(1, 2, 3, 4)
+        gr.add_cdu('X', [1, 2])
+        gr.add_cdu('Y', ['X', 3])
+        gr.add_rel('a', 3, 4)
+        self.assertEqual('X', gr.containing_cdu('1'))
+        self.assertEqual('Y', gr.containing_cdu('3'))
+        self.assertEqual(set(['X', '1', '2', '3']),
+                         gr.cdu_members('Y', deep=True))
+        self.assertEqual(1, len(gr.connected_components()))
+
+        gr.del_edge('a')
+        gr.del_node('a')
+        gr.unlink('X', 'Y')
+        gr.unlink('3', 'Y')
+        self.assertEqual(None, gr.containing_cdu('3'))
+        self.assertEqual(frozenset(), gr.cdu_members('Y', deep=True))
+        self.assertEqual(set([frozenset(['X', '1', '2']),
+                              frozenset(['Y']),
+                              frozenset(['3']),
+                              frozenset(['4'])]),
+                         gr.connected_components())
+
+    def test_delete(self):
+        "deleting nodes and edges keeps links and types in sync"
+        gr = FakeGraph()
+        gr.add_edus(1, 2, 3)
+        gr.add_rel('a', 1, 2)
+        gr.add_cdu('X', [2, 3])
+        self.assertEqual(['1', '2'], gr.links('a'))
+        self.assertRaises(educe.AdditionError, gr.link, '1', 'a')
+
+        gr.del_edge('X')
+        self.assertEqual(frozenset(), gr.cdus())
+        self.assertEqual(['a'], gr.links('2'))
+        gr.del_node('2')
+        self.assertEqual(set(['1', '3']), gr.edus())
+        self.assertEqual(['1'], gr.links('a'))
+        self.assertEqual(set(['a']), gr.relations())
+
 
 def test_relative_indices():
     """Test for relative_indices"""
@@ -357,3 +869,30 @@ def test_relative_indices():
 
     inv_exa2 = [0, 0, 1, 0, 0, 0]
     assert relative_indices(example2, reverse=True, valna=0) == inv_exa2
+
+
+class FakePairDoc(object):
+    "Stand-in for a document with EDUs grouped in sentences"
+    def __init__(self, edu2sent):
+        self.edu2sent = edu2sent
+
+
+def test_pair_policies():
+    """Test for pruning policies on EDU pairs"""
+    doc = FakePairDoc([None, 0, 0, 1, 2, None])
+    distance = MaxDistance(2)
+    adjacent = SameOrAdjacent('edu2sent')
+    assert distance.keep(doc, 0, 5)
+    assert distance.keep(doc, 3, 1)
+    assert not distance.keep(doc, 1, 4)
+    assert adjacent.keep(doc, 1, 3)
+    assert not adjacent.keep(doc, 4, 1)
+    assert adjacent.keep(doc, 1, 5)  # benefit of the doubt
+    assert keeps([], doc, 1, 5)
+    assert not keeps([distance, adjacent], doc, 2, 4)
+
+    report = coverage([distance, adjacent], [doc],
+                      lambda _: [(0, 4), (1, 2), (1, 4), (2, 5)])
+    assert report == [('distance<=2', 4, 2),
+                      ('adjacent-edu2sent', 4, 1),
+                      ('all', 4, 2)]
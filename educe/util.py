@@ -67,6 +67,68 @@ def add_corpus_filters(parser,
             add(field, choices=None)
 
 
+def add_cache_args(parser):
+    """
+    For help with script-building:
+
+    Augment an argparser with options on reading the corpus: a
+    `--cache-dir` to keep parsed documents on disk between runs (see
+    `educe.cache`), and `--workers` to parse them in a pool of
+    processes. Pass `args.cache_dir` and `args.workers` on to
+    `educe.corpus.Reader.slurp`
+    """
+    parser.add_argument('--cache-dir', metavar='DIR',
+                        help='Keep parsed files in DIR and reload '
+                        'unchanged ones from there on later runs')
+    parser.add_argument('--workers', '-j', metavar='N', type=int,
+                        help='Parse N files at a time')
+
+
+def mk_field_filters(args,
+                     preselected=None):
+    """
+    Return a dictionary from `FileId` field names to predicates on the
+    values of that field, for the fields on which the arguments passed
+    in (see `add_corpus_filters`) ask us to filter.
+
+    This lets corpus readers skip uninteresting parts of the corpus
+    as early as possible (see eg. `educe.stac.Reader.files`); note
+    that a FileId whose value for a filtered field is `None` never
+    counts as a match.
+
+    :param preselected: fields for which we already know what
+                        matches we want
+    :type preselected: Dict String [String]
+    """
+    preselected = preselected or {}
+
+    def mk_pred(attr):
+        "value predicate for an attribute (None if unconstrained)"
+        if attr in preselected:
+            return lambda v: v in preselected[attr]
+        elif args.__dict__.get(attr) is None:
+            return None
+        else:
+            return re.compile(args.__dict__[attr]).match
+
+    filters = {}
+    for attr in FILEID_FIELDS:
+        pred = mk_pred(attr)
+        if pred is not None:
+            filters[attr] = pred
+    return filters
+
+
+def doc_filters(args):
+    """
+    The document and subdocument filters requested in the command
+    line arguments (see `mk_field_filters`)
+    """
+    filters = mk_field_filters(args)
+    return dict((k, v) for k, v in filters.items()
+                if k in ['doc', 'subdoc'])
+
+
 def mk_is_interesting(args,
                       preselected=None):
     """
@@ -80,33 +142,19 @@ def mk_is_interesting(args,
 
     Meant to be used in conjunction with `add_corpus_filters`
     """
-    preselected = preselected or {}
-
-    def mk_checker_generic(attr, pred):
-        "generalised helper for mk_checker"
-        def check(fileid):
-            "matching on k value"
-            val = fileid.__dict__[attr]
-            return False if val is None else pred(val)
-        return check
-
-    def mk_checker(attr):
+    def mk_checker(attr, pred):
         """
         Given an attr name, return a function that checks a FileId
         to see if its attribution value matches the requested pattern.
-        If the attribute was not requested, we skip the check.
         """
-        if attr in preselected:
-            pred = lambda v: v in preselected[attr]
-            return mk_checker_generic(attr, pred)
-        elif args.__dict__.get(attr) is None:
-            return lambda _: True
-        else:
-            argval = args.__dict__[attr]
-            regex = re.compile(argval)
-            return mk_checker_generic(attr, regex.match)
+        def check(fileid):
+            "matching on k value"
+            val = getattr(fileid, attr)
+            return False if val is None else pred(val)
+        return check
 
-    doc_checkers = [mk_checker(attr) for attr in FILEID_FIELDS]
+    filters = mk_field_filters(args, preselected=preselected)
+    doc_checkers = [mk_checker(attr, pred) for attr, pred in filters.items()]
     return lambda k: all(check(k) for check in doc_checkers)
 
 